@@ -0,0 +1,47 @@
+import numpy as np
+
+class ActionRegistry:
+    # The action set: every (pitch_type, zone) pair seen in the data, sorted, with zones as ints.
+    # Indexing goes both ways in O(1): registry[i] is the pair and registry.index[pair] its
+    # position (float zones like 5.0 hash the same as 5, so raw Statcast values look up directly).
+    def __init__(self, pairs):
+        self.actions = sorted({(str(pitch_type), int(zone)) for pitch_type, zone in pairs
+                               if isinstance(pitch_type, str) and zone == zone})
+        self.index = {action: i for i, action in enumerate(self.actions)}
+        self.pitch_types = sorted({pitch_type for pitch_type, _ in self.actions})
+        self.zones = np.array([zone for _, zone in self.actions], dtype=np.int64)
+
+        # one boolean column mask per pitch type; arsenal masks are ORs of these, kept once built
+        types = np.array([pitch_type for pitch_type, _ in self.actions], dtype=object)
+        self.type_masks = {pitch_type: types == pitch_type for pitch_type in self.pitch_types}
+        self.arsenal_masks = {}
+
+    @classmethod
+    def from_index(cls, index):
+        # Union of the (pitch_type, zone) levels of a (count, pitch_type, zone) index
+        return cls(zip(index.get_level_values(1), index.get_level_values(2)))
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __getitem__(self, i):
+        return self.actions[i]
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def lookup(self, pitch_types, zones):
+        # Action index of every (pitch_type, zone) pair, -1 for pairs outside the action set
+        return np.array([self.index.get(k, -1) for k in zip(pitch_types, zones)], dtype=np.int64)
+
+    def mask(self, arsenal):
+        key = frozenset(arsenal)
+        mask = self.arsenal_masks.get(key)
+        if mask is None:
+            mask = np.zeros(len(self.actions), dtype=bool)
+            for pitch_type in key:
+                if pitch_type in self.type_masks:
+                    mask |= self.type_masks[pitch_type]
+            mask.setflags(write=False)
+            self.arsenal_masks[key] = mask
+        return mask
@@ -1,74 +1,173 @@
 import gradio as gr
+import io
 import numpy as np
-from qlearning import QLearning
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from qlearning import init_worker, q_learn
 import load_statcast
-from pitch_perfect import PitchPerfect
-import matplotlib.pyplot as plt
-import seaborn as sns
+from player_cache import PlayerCache
+from player_index import PlayerIndex
+from model_store import league_model, model_key
+from policy_store import PolicyStore
+import policy_api
+from policy_api import policy_json
+from lru_cache import LRUCache
+from PIL import Image
+from render import render_heat_map
+from metrics import registry as metrics, setup_logging
 
-def run_notebook(pitcher_name, batter_name):
+ETA = 0.01
+GAMMA = 0.99
+
+def data_version(role, player_id):
+    version = players.version(role, player_id)
+    previous = seen_versions.setdefault((role, player_id), version)
+    if previous != version:
+        # The player's data was refreshed, drop everything computed from the old data
+        seen_versions[(role, player_id)] = version
+        if role == 'pitcher':
+            pitcher_models.invalidate(lambda key: key[0] == player_id)
+            matchups.invalidate(lambda key: key[0] == player_id)
+        else:
+            matchups.invalidate(lambda key: key[2] == player_id)
+    return version
+
+def load_player(role, name):
+    # Runs on the fetch pool so the pitcher and batter are fetched and encoded at the same time.
+    # name can also be an MLBAM id, which is what API clients usually send.
+    with metrics.span('lookup', role=role):
+        player_id = names.player_id(name)
+    with metrics.span('fetch', role=role, player=player_id):
+        data = load_statcast.get_player_data(role, player_id, cache=players)
+        version = data_version(role, player_id)
+    with metrics.span('get_obs', role=role, player=player_id, pitches=len(data)):
+        obs = p.get_obs(data)
+    return player_id, data, version, obs
+
+def pitcher_stage(pitcher_id, version, obs_pitcher, solver):
+    # League model updated with the pitcher's data, shared by every batter they face
+    key = (pitcher_id, version, ETA, GAMMA, solver)
+    stage = pitcher_models.get(key)
+    if stage is None:
+        with metrics.span('train_pitcher', player=pitcher_id, solver=solver, pitches=len(obs_pitcher)):
+            if solver == "Model-based":
+                _, stage = model.model_based_q(obs_pitcher, gamma=GAMMA)
+            else:
+                stage = train_pool.submit(q_learn, obs_pitcher, ETA, GAMMA).result()
+        pitcher_models.put(key, stage)
+    return stage
+
+def train_matchup(pitcher, batter, solver):
+    # pitcher and batter are load_player results; returns Q for the matchup
+    pitcher_id, data_pitcher, pitcher_version, obs_pitcher = pitcher
+    stage = pitcher_stage(pitcher_id, pitcher_version, obs_pitcher, solver)
+    with metrics.span('train_batter', player=batter[0], solver=solver, pitches=len(batter[3])):
+        if solver == "Model-based":
+            # Pitcher data updates the league model, batter data updates the pitcher's model
+            Qb, _ = model.model_based_q(batter[3], gamma=GAMMA, T=stage)
+        else:
+            Qb = train_pool.submit(q_learn, batter[3], ETA, GAMMA, stage).result()
+    return Qb
+
+def store_policy(pitcher, batter, solver, Qb, arsenal):
+    with metrics.span('store_policy'):
+        policy = p.get_policy(Qb, arsenal)
+        version = f"{league_version}:{pitcher[2]}:{batter[2]}:{ETA}:{GAMMA}"
+        return policies.put(pitcher[0], batter[0], solver, version, policy, arsenal, Qb[:12])
+
+def query_policy(pitcher_name, batter_name, solver="Q-learning", include_q=False):
+    # JSON API: read the matchup from the policy store, computing it only on a miss
+    pitcher_future = fetch_pool.submit(load_player, 'pitcher', pitcher_name)
+    batter_future = fetch_pool.submit(load_player, 'batter', batter_name)
+    pitcher, batter = pitcher_future.result(), batter_future.result()
+
+    arsenal = list(pitcher[1]['pitch_type'].drop_duplicates())
+    if not p.actions.mask(arsenal).any():
+        # get_policy would pick action 0 for every count
+        raise ValueError(f"no pitches on record for pitcher {pitcher[0]}")
+
+    version = f"{league_version}:{pitcher[2]}:{batter[2]}:{ETA}:{GAMMA}"
+    entry = policies.get(pitcher[0], batter[0], solver, version)
+    if entry is None:
+        entry = store_policy(pitcher, batter, solver, train_matchup(pitcher, batter, solver), arsenal)
+    policy, arsenal, q = entry
+    return policy_json(p, pitcher[0], batter[0], solver, policy, arsenal, q if include_q else None)
+
+def run_notebook(pitcher_name, batter_name, solver="Q-learning", progress=gr.Progress()):
+    with metrics.profiled('run_notebook'), metrics.span('run_notebook', pitcher=pitcher_name, batter=batter_name, solver=solver):
+        return matchup_view(pitcher_name, batter_name, solver, progress)
+
+def matchup_view(pitcher_name, batter_name, solver, progress):
     # Example: Simulate running part of the notebook
     zones = gr.Image("zones2.png")
-    pitcher = pitcher_name.split()
-    batter = batter_name.split()
-    fig = plt.figure(figsize=(8, 30))
 
-    print(f"Gathering pitcher data for pitcher {pitcher_name}")
+    progress(0, desc=f"Gathering data for {pitcher_name} and {batter_name}")
+    pitcher_future = fetch_pool.submit(load_player, 'pitcher', pitcher_name)
+    batter_future = fetch_pool.submit(load_player, 'batter', batter_name)
     try:
-       data_pitcher = load_statcast.get_pitcher_data(pitcher[1], pitcher[0])
-       obs_pitcher = p.get_obs(data_pitcher)
+       pitcher = pitcher_future.result()
+       pitcher_id, data_pitcher, pitcher_version, obs_pitcher = pitcher
     except:
-       return "Whoops, looks like that pitcher name was not valid.", zones, fig
-    print("Success!")
+       return "Whoops, looks like that pitcher name was not valid.", zones, None
 
     arsenal = list(data_pitcher['pitch_type'].drop_duplicates())
+    if not p.actions.mask(arsenal).any():
+       return "Whoops, looks like that pitcher has no pitches on record.", zones, None
 
-    print(f"Gathering batter data for batter {batter_name}")
     try:
-        data_batter = load_statcast.get_batter_data(batter[1], batter[0])
-        obs_batter = p.get_obs(data_batter)
+        batter = batter_future.result()
+        batter_id, data_batter, batter_version, obs_batter = batter
     except:
-       return "Whoops, looks like that batter name was not valid.", zones, fig
-    print("Success!")
+       return "Whoops, looks like that batter name was not valid.", zones, None
 
-    print("Optimizing Q for this pitcher and batter combo")
-    Qp = Q.copy()
-    Qp = model.QLearn(Qp, obs_pitcher, 0.01, gamma=0.99)
+    matchup = (pitcher_id, pitcher_version, batter_id, batter_version, ETA, GAMMA, solver)
+    cached = matchups.get(matchup)
+    if cached is not None:
+        pitch_sequence, heat_map, png = cached
+        return pitch_sequence, zones, Image.open(io.BytesIO(png))
 
-    Qb = Qp.copy()
-    Qb = model.QLearn(Qb, obs_batter, 0.01, gamma=0.99)
+    progress(0.25, desc="Optimizing Q for this pitcher and batter combo")
+    Qb = train_matchup(pitcher, batter, solver)
 
-    print("Calculating pitch sequence")
-    seq = p.get_pitch_seq(Qb, arsenal)
+    progress(0.6, desc="Calculating pitch sequence")
+    store_policy(pitcher, batter, solver, Qb, arsenal)
+    with metrics.span('get_pitch_seq'):
+        seq = p.get_pitch_seq(Qb, arsenal)
     pitch_sequence = ""
 
     states = list(p.state_lookup)
     for i in range(len(seq)):
-      pitch_sequence += (states[i] + ": "+ str(p.pitches[seq[i][0]]) + ", Zone " + str(seq[i][1]) + "\n")
-
-    print("Done!")
-
-    data, min, max = p.generate_heat_map(Qb, arsenal)
-    plt.rcParams.update({'font.size': 8})
-    for i in range(len(arsenal)):
-        for j in range(12):
-            ax = fig.add_subplot(3*len(arsenal), 4, 12 * i + j+1)
-            heatmap = data[j, i, :, :]
-            nan_mask = np.isnan(heatmap)
-            sns.heatmap(heatmap, cmap="RdBu", ax=ax, mask=nan_mask, cbar=True, square=True)
-            #im = ax.imshow(data[j, i, :, :], cmap="RdBu")
-            ax.set_title(f'{arsenal[i]} in {states[j]}')
-            ax.set_axis_off()
-    return pitch_sequence, zones, fig
-
-# start by initializing Q with all data
-print("Retrieving all statcast data... (this should only happen once)")
-data = load_statcast.retrieve_data()
-print("Creating models")
-p = PitchPerfect(data)
-model = QLearning(p)
-print("Initializing Q learning")
-Q, U_rand = model.initialize_q(data)
+      pitch_sequence += (states[i] + ": "+ str(p.pitches.get(seq[i][0], seq[i][0])) + ", Zone " + str(seq[i][1]) + "\n")
+
+    progress(0.7, desc="Drawing Q values")
+    with metrics.span('heat_map', pitches=len(arsenal)):
+        data, min, max = p.generate_heat_map(Qb, arsenal)
+    with metrics.span('render', pitches=len(arsenal)):
+        # PNG bytes are much smaller to keep in the cache than a live Figure
+        png = render_heat_map(data, arsenal, states, min, max, png=True)
+
+    matchups.put(matchup, (pitch_sequence, data, png))
+    return pitch_sequence, zones, Image.open(io.BytesIO(png))
+
+# Stage timings are logged as JSON lines to stderr, or to the file in METRICS_LOG
+setup_logging(os.environ.get("METRICS_LOG"))
+
+# start by initializing Q with all data, or restore it from the last saved snapshot
+with metrics.span('startup.league_model'):
+    p, model, Q, U_rand = league_model()
+league_version = model_key(load_statcast.START_DT, load_statcast.END_DT)
+
+players = PlayerCache()
+seen_versions = {}
+# Pitcher-stage models and finished matchups are kept in memory, least recently used evicted first
+pitcher_models = LRUCache(maxsize=32)
+matchups = LRUCache(maxsize=256)
+print("Loading player names")
+with metrics.span('startup.player_index'):
+    names = PlayerIndex.from_register()
+# Computed matchups for the JSON API, which runs next to the UI when POLICY_API_PORT is set
+policies = PolicyStore()
 
 # Uncomment these lines to compare U^* with a random policy
 # U_star = np.amax(Q, axis=1)
@@ -79,10 +178,32 @@ Q, U_rand = model.initialize_q(data)
 # print("U_rand std:", U_rand_std)
 # print("U_rand mean:", U_rand_mean)
 
+# Player fetches are I/O bound and go to a small thread pool. Q-learning is CPU bound and goes
+# to worker processes that each get a read-only copy of the league Q once. Workers are started
+# here, before Gradio starts its threads, since they are forked from this process.
+WORKERS = os.cpu_count() or 1
+fetch_pool = ThreadPoolExecutor(max_workers=2*WORKERS)
+with metrics.span('startup.workers', workers=WORKERS):
+    train_pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("fork"),
+                                     initializer=init_worker, initargs=(np.asarray(Q),))
+    train_pool.submit(int).result()
+
+metrics.gauge('matchups', matchups.stats)
+metrics.gauge('pitcher_models', pitcher_models.stats)
+metrics.gauge('players', players.stats)
+metrics.gauge('policies', policies.stats)
+# PROFILE_SLOW_MS profiles the first request and keeps the profile if it took that long
+if os.environ.get("PROFILE_SLOW_MS"):
+    metrics.arm_profile(float(os.environ["PROFILE_SLOW_MS"]))
+
 title = "Pitch Perfect"
 f = open("description.md")
 desc = f.read()
 
-interface = gr.Interface(theme=gr.themes.Soft(), fn=run_notebook, inputs=[gr.Textbox(label="Pitcher Name"), gr.Textbox(label="Batter Name")], outputs=[gr.Textbox(label="The predicted optimal pitch sequence is:"), gr.Image(label="Pitch Zones (for reference)"), gr.Plot(label="Q values by pitch and count", format="png")], title=title,
+interface = gr.Interface(theme=gr.themes.Soft(), fn=run_notebook, inputs=[gr.Textbox(label="Pitcher Name"), gr.Textbox(label="Batter Name"), gr.Radio(["Q-learning", "Model-based"], value="Q-learning", label="Solver")], outputs=[gr.Textbox(label="The predicted optimal pitch sequence is:"), gr.Image(label="Pitch Zones (for reference)"), gr.Image(label="Q values by pitch and count", format="png")], title=title,
                 description=desc)
+interface.queue(default_concurrency_limit=WORKERS, max_size=8*WORKERS)
+if os.environ.get("POLICY_API_PORT"):
+    policy_api.serve(query_policy, port=int(os.environ["POLICY_API_PORT"]), host=os.environ.get("POLICY_API_HOST", "127.0.0.1"),
+                     metrics=metrics, profile_token=os.environ.get("PROFILE_TOKEN"))
 interface.launch(debug=True)
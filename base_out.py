@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+from transitions import SparseT
+
+# Half-inning model: every count in each of the 24 base-out situations (3 outs x 8 base states),
+# 288 states plus END after the third out. Pitch outcomes come from the count model; what an
+# at-bat result does to the runners is fixed by the rules below. The reward is minus the runs
+# that score, so U at 0-0 is minus the run expectancy of each base-out situation.
+
+# Share of each hit type (single, double, triple, home run) among hits, roughly the 2024 league split
+HIT_TYPES = np.array([0.65, 0.20, 0.02, 0.13])
+BASES = ['---', '1--', '-2-', '12-', '--3', '1-3', '-23', '123']
+END = 288
+
+def runners(bases):
+    return bin(bases).count('1')
+
+def hit(bases, h):
+    # Batter reaches base h and every runner moves up h bases
+    return 0 if h == 4 else ((bases << h) | (1 << (h - 1))) & 7
+
+def walk(bases):
+    # Batter to first, runners only move when forced
+    for base in (1, 2, 4):
+        if not bases & base:
+            return bases | base
+    return 7
+
+def state(count, outs, bases):
+    return (outs*8 + bases)*12 + count
+
+class BaseOutModel:
+    # Duck-types the parts of PitchPerfect that QLearning reads; use QLearning(model, sparse=True)
+    def __init__(self, p):
+        counts = list(p.state_lookup)
+        self.state_lookup = {f'{count}, {outs} out, {BASES[bases]}': state(c, outs, bases)
+                             for outs in range(3) for bases in range(8) for c, count in enumerate(counts)}
+        self.actions = p.actions
+        self.has_data = np.zeros((END + 1, len(p.actions)), dtype=bool)
+        self.has_data[:END] = np.tile(p.has_data[:12], (24, 1))
+
+        # successor and runs of each count-model outcome (0-15) in each base-out situation, and
+        # of each hit type
+        self.successor = np.zeros((24, 16), dtype=np.int64)
+        self.runs = np.zeros((24, 16))
+        self.hit_successor = np.zeros((24, 4), dtype=np.int64)
+        self.hit_runs = np.zeros((24, 4))
+        for outs in range(3):
+            for bases in range(8):
+                c = outs*8 + bases
+                self.successor[c, :12] = state(np.arange(12), outs, bases)
+                for h in range(4):
+                    self.hit_successor[c, h] = state(0, outs, hit(bases, h + 1))
+                    self.hit_runs[c, h] = runners(bases) + 1 - runners(hit(bases, h + 1))
+                self.successor[c, 12], self.runs[c, 12] = self.hit_successor[c, 0], self.hit_runs[c, 0]
+                self.successor[c, [13, 15]] = state(0, outs + 1, bases) if outs < 2 else END
+                self.successor[c, 14] = state(0, outs, walk(bases))
+                self.runs[c, 14] = runners(bases) + 1 - runners(walk(bases))
+
+        self.R_s = np.zeros((END + 1, END + 1))
+        s = np.arange(END).reshape(24, 12)
+        for c in range(24):
+            self.R_s[s[c][:, np.newaxis], self.successor[c]] = -self.runs[c]
+            self.R_s[s[c][:, np.newaxis], self.hit_successor[c]] = -self.hit_runs[c]
+        self.R_s[:, END] = 0
+        self.T = self.lift(p.get_sparse_T())
+
+    def lift(self, T):
+        # Expands a count-model SparseT (slot layout of transitions.count_transitions) to the
+        # base-out states: the HIT slot splits into the four hit types, every other slot maps to
+        # its successor in the same situation. A player's blended count T lifts the same way.
+        idx, prob = np.broadcast_to(T.idx, T.prob.shape)[..., :12, :, :], T.prob[..., :12, :, :]
+        lead, A = idx.shape[:-3], idx.shape[-2]
+        hits = prob[..., np.newaxis, :, :, 0, np.newaxis] * HIT_TYPES
+        hit_idx = np.broadcast_to(self.hit_successor[:, np.newaxis, np.newaxis, :], lead + (24, 12, A, 4))
+        rest_idx = self.successor[np.arange(24).reshape(24, 1, 1, 1), idx[..., np.newaxis, :, :, 1:]]
+        rest = np.broadcast_to(prob[..., np.newaxis, :, :, 1:], rest_idx.shape)
+
+        K = 4 + idx.shape[-1] - 1
+        new_idx = np.full(lead + (END + 1, A, K), END, dtype=np.int64)
+        new_prob = np.zeros(lead + (END + 1, A, K))
+        new_idx[..., :END, :, :] = np.concatenate([hit_idx, rest_idx], axis=-1).reshape(lead + (END, A, K))
+        new_prob[..., :END, :, :] = np.concatenate([np.broadcast_to(hits, hit_idx.shape), rest], axis=-1).reshape(lead + (END, A, K))
+        new_prob[..., END, :, 0] = 1
+        return SparseT(new_idx, new_prob, END + 1)
+
+    def get_sparse_T(self):
+        return self.T
+
+    def get_Rs(self):
+        return self.R_s
+
+    def get_R(self):
+        return self.T.reward(self.R_s)
+
+    def situation(self, Q, outs, bases):
+        # The 12 count rows of Q for one base-out situation, laid out like the count model's Q[:12]
+        return Q[state(0, outs, bases):state(0, outs, bases) + 12]
+
+    def lift_obs(self, obs, seed=0):
+        # Count-model observations (get_obs) repeated in all 24 situations for Q-learning on this
+        # state space. The data doesn't say what kind of hit a HIT was, so each one draws its
+        # hit type from HIT_TYPES (seeded, so training is repeatable).
+        s, a, sp = (np.asarray(obs[col], dtype=np.int64) for col in ('s', 'a', 'sp'))
+        c = np.repeat(np.arange(24), len(s))
+        s, a, sp = np.tile(s, 24), np.tile(a, 24), np.tile(sp, 24)
+        h = np.random.default_rng(seed).choice(4, size=len(s), p=HIT_TYPES)
+        is_hit = sp == 12
+        return pd.DataFrame({
+            's': c*12 + s,
+            'a': a,
+            'r': -np.where(is_hit, self.hit_runs[c, h], self.runs[c, sp]),
+            'sp': np.where(is_hit, self.hit_successor[c, h], self.successor[c, sp])
+        })
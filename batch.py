@@ -0,0 +1,104 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import load_statcast
+from model_store import league_model, model_key
+from player_cache import PlayerCache
+from player_index import PlayerIndex
+from qlearning import init_worker, q_learn
+
+# Precomputes optimal pitch sequences for every pitcher x batter pair, e.g. a staff against an
+# opposing lineup. Each player is fetched and encoded once, each pitcher stage is trained once,
+# and the batter stages fan out over a process pool. Results go to one npz file with a row per
+# pair, which is rewritten after every pitcher so an interrupted run picks up where it stopped.
+
+def load_results(path, actions=None, eta=None, gamma=None, key=None):
+    # Results computed over a different action set can't be reused, their indices mean other pitches.
+    # Neither can ones trained with other learning rates or on another league model (key is the
+    # model_store.model_key the league Q came from).
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as z:
+        if actions is not None and list(zip(z['action_pitch_type'], z['action_zone'])) != list(actions):
+            return {}
+        if 'eta' not in z or (eta is not None and float(z['eta']) != eta) or \
+           (gamma is not None and float(z['gamma']) != gamma) or (key is not None and str(z['model_key']) != key):
+            return {}
+        return {(int(pitcher), int(batter)): (policy, q)
+                for pitcher, batter, policy, q in zip(z['pitcher'], z['batter'], z['policy'], z['q'])}
+
+def save_results(path, results, actions, eta, gamma, key):
+    pairs = sorted(results)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, eta=eta, gamma=gamma, model_key=key,
+                 pitcher=np.array([pitcher for pitcher, _ in pairs], dtype=np.int64),
+                 batter=np.array([batter for _, batter in pairs], dtype=np.int64),
+                 policy=np.array([results[pair][0] for pair in pairs], dtype=np.int16).reshape(len(pairs), 12),
+                 q=np.array([results[pair][1] for pair in pairs], dtype=np.float64).reshape(len(pairs), 12, len(actions)),
+                 action_pitch_type=np.array([pitch_type for pitch_type, _ in actions], dtype=str),
+                 action_zone=np.array([zone for _, zone in actions], dtype=np.int64))
+    os.replace(path + '.tmp', path)
+
+def run_batch(pitchers, batters, out_path, p, Q, eta=0.01, gamma=0.99, cache=None, workers=None, key=''):
+    # pitchers and batters are MLBAM ids. Returns {(pitcher, batter): (policy, Q[:12])} where
+    # policy holds the action index get_pitch_seq picks for each of the 12 counts.
+    results = load_results(out_path, p.actions, eta, gamma, key)
+    todo = {pitcher: [batter for batter in batters if (pitcher, batter) not in results] for pitcher in pitchers}
+    todo = {pitcher: todo_batters for pitcher, todo_batters in todo.items() if todo_batters}
+    if not todo:
+        return results
+
+    def load(role, player_id):
+        data = load_statcast.get_player_data(role, player_id, cache=cache)
+        return data, p.get_obs(data)
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                             initializer=init_worker, initargs=(np.asarray(Q),)) as train_pool, \
+         ThreadPoolExecutor(max_workers=2*workers) as fetch_pool:
+        # The first submit forks all the workers, do it before any fetch thread exists: a child
+        # forked while threads are running can inherit locks they hold
+        train_pool.submit(int).result()
+        batter_ids = {batter for todo_batters in todo.values() for batter in todo_batters}
+        pitcher_data = {pitcher: fetch_pool.submit(load, 'pitcher', pitcher) for pitcher in todo}
+        batter_data = {batter: fetch_pool.submit(load, 'batter', batter) for batter in batter_ids}
+
+        pitcher_stages = {}
+        for pitcher, future in pitcher_data.items():
+            pitcher_stages[pitcher] = train_pool.submit(q_learn, future.result()[1], eta, gamma)
+
+        for pitcher, todo_batters in todo.items():
+            data_pitcher = pitcher_data[pitcher].result()[0]
+            arsenal = list(data_pitcher['pitch_type'].drop_duplicates())
+            Qp = pitcher_stages.pop(pitcher).result()
+            stages = {batter: train_pool.submit(q_learn, batter_data[batter].result()[1], eta, gamma, Qp)
+                      for batter in todo_batters}
+            for batter, stage in stages.items():
+                Qb = stage.result()
+                results[(pitcher, batter)] = (p.get_policy(Qb, arsenal), Qb[:12])
+            save_results(out_path, results, p.actions, eta, gamma, key)
+            print(f"Finished pitcher {pitcher} against {len(todo_batters)} batters")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute pitch sequences for every pitcher x batter pair")
+    parser.add_argument('--pitchers', nargs='+', required=True, help="pitcher names or MLBAM ids")
+    parser.add_argument('--batters', nargs='+', required=True, help="batter names or MLBAM ids")
+    parser.add_argument('--out', default='matchups.npz', help="results file, also used as the checkpoint")
+    parser.add_argument('--eta', type=float, default=0.01)
+    parser.add_argument('--gamma', type=float, default=0.99)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    p, model, Q, U_rand = league_model()
+    names = PlayerIndex.from_register()
+    pitchers = [names.player_id(pitcher) for pitcher in args.pitchers]
+    batters = [names.player_id(batter) for batter in args.batters]
+    results = run_batch(pitchers, batters, args.out, p, Q, args.eta, args.gamma, cache=PlayerCache(), workers=args.workers,
+                        key=model_key(load_statcast.START_DT, load_statcast.END_DT))
+    print(f"{len(results)} matchups in {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import load_statcast
+from pitch_perfect import PitchPerfect
+from qlearning import QLearning
+from benchmarks import synthetic
+
+# Times every stage of the pipeline on synthetic Statcast data (no network needed) and reports
+# wall time, peak traced memory and throughput. Results can be saved as a JSON baseline and
+# later runs compared against it:
+#   python -m benchmarks.run --save baseline.json
+#   python -m benchmarks.run --compare baseline.json
+
+def measure(fn, items, repeat=3):
+    # One traced run for the peak Python-allocated memory (numpy buffers included), which also
+    # warms up caches and lazy imports, then the best wall time of repeat runs.
+    # Returns the stage record and fn's result.
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+    return {'seconds': seconds, 'peak_mb': peak / 2**20, 'items': items, 'per_second': items / seconds if seconds else None}, result
+
+def run(league_rows=700000, player_rows=3000, epochs=100, repeat=3, seed=0):
+    league = synthetic.statcast(league_rows, seed)
+    pitcher = synthetic.player(player_rows, seed + 1)
+    arsenal = list(pitcher['pitch_type'].drop_duplicates())
+    stages = {}
+
+    def stage(name, fn, items, repeat=repeat):
+        stages[name], result = measure(fn, items, repeat)
+        print(f"{name:<18} {stages[name]['seconds']*1000:10.2f} ms {stages[name]['peak_mb']:9.1f} MB "
+              f"{stages[name]['per_second'] or 0:14.0f} items/s")
+        return result
+
+    data = stage('retrieve_data', lambda: load_statcast.retrieve_data(load_statcast.START_DT, load_statcast.END_DT,
+                                                                        fetcher=lambda start, end: league), len(league))
+    p = stage('model', lambda: PitchPerfect(data), len(data))
+    stage('get_T_get_R', lambda: rebuild_T(p), p.has_data.size)
+    model = QLearning(p)
+    stage('value_iteration', lambda: model.value_iteration(), model.T.size)
+    Q, _ = stage('initialize_q', lambda: model.initialize_q(), model.T.size, repeat=1)
+    obs = stage('get_obs', lambda: p.get_obs(pitcher), len(pitcher))
+    Qp = stage('QLearn', lambda: model.QLearn(Q.copy(), obs, 0.01, 0.99, epochs), len(obs)*epochs, repeat=1)
+    stage('get_pitch_seq', lambda: p.get_pitch_seq(Qp, arsenal), 12)
+    heat_map, vmin, vmax = stage('generate_heat_map', lambda: p.generate_heat_map(Qp, arsenal), 12*len(arsenal)*160)
+
+    try:
+        from render import render_heat_map
+    except ImportError:
+        print("matplotlib is not installed, skipping the render stages")
+    else:
+        states = list(p.state_lookup)
+        stage('render', lambda: render_heat_map(heat_map, arsenal, states, vmin, vmax), heat_map.size)
+        stage('render_png', lambda: render_heat_map(heat_map, arsenal, states, vmin, vmax, png=True), heat_map.size)
+
+    return {
+        'config': {'league_rows': league_rows, 'player_rows': player_rows, 'epochs': epochs, 'seed': seed},
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine()},
+        'stages': stages
+    }
+
+def rebuild_T(p):
+    # get_T caches T on the model, drop it so the construction itself is timed
+    p.T = None
+    return p.get_T(), p.get_R()
+
+def compare(results, baseline, threshold=1.2, min_ms=1.0):
+    # Prints each stage's time against the baseline; returns the stages that got slower than
+    # threshold x and by more than min_ms (sub-millisecond stages are mostly timer noise)
+    if baseline['config'] != results['config']:
+        print(f"Warning: baseline was run with {baseline['config']}")
+    slower = []
+    for name, stage in results['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+        ratio = stage['seconds'] / before['seconds']
+        flag = ''
+        if ratio > threshold and (stage['seconds'] - before['seconds'])*1000 > min_ms:
+            slower.append(name)
+            flag = '  SLOWER'
+        print(f"{name:<18} {before['seconds']*1000:10.2f} -> {stage['seconds']*1000:10.2f} ms  x{ratio:5.2f}"
+              f"  peak {before['peak_mb']:.1f} -> {stage['peak_mb']:.1f} MB{flag}")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic Statcast data")
+    parser.add_argument('--league-rows', type=int, default=700000, help="pitches in the league season (~700k is a real one)")
+    parser.add_argument('--player-rows', type=int, default=3000, help="pitches in the player's season")
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="compare against a JSON baseline, exits with 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown factor that counts as a regression")
+    parser.add_argument('--min-ms', type=float, default=1.0, help="smallest slowdown in ms that counts as a regression")
+    args = parser.parse_args()
+
+    results = run(args.league_rows, args.player_rows, args.epochs, args.repeat, args.seed)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.threshold, args.min_ms)
+        if slower:
+            print(f"Slower than baseline: {', '.join(slower)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
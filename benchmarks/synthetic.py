@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Deterministic stand-in for Statcast pulls. At-bats are simulated pitch by pitch until they end,
+# so counts, descriptions and events are consistent with each other the way real data is, and
+# the same (rows, seed) always gives the same frame of at most rows pitches. Rows come newest
+# first like statcast() returns them.
+
+PITCH_TYPES = ['FF', 'SI', 'SL', 'CH', 'CU', 'FC', 'ST', 'FS', 'KC', 'SV']
+PITCH_MIX = np.array([0.32, 0.15, 0.15, 0.10, 0.07, 0.07, 0.06, 0.04, 0.03, 0.01])
+ZONES = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 11, 12, 13, 14])
+HITS = ['single', 'double', 'triple', 'home_run']
+HIT_MIX = np.array([0.65, 0.20, 0.02, 0.13])
+OUTS = ['field_out', 'grounded_into_double_play', 'force_out', 'sac_fly', 'field_error']
+OUT_MIX = np.array([0.88, 0.05, 0.04, 0.02, 0.01])
+
+def statcast(rows, seed=0, pitch_types=None, start_dt='2024-04-01', days=180):
+    rng = np.random.default_rng(seed)
+    if pitch_types is None:
+        types, mix = np.array(PITCH_TYPES), PITCH_MIX
+    else:
+        types = np.array(pitch_types)
+        mix = np.array([PITCH_MIX[PITCH_TYPES.index(t)] if t in PITCH_TYPES else 0.05 for t in pitch_types])
+        mix = mix / mix.sum()
+
+    # each pitch type has its own zone tendencies, e.g. breaking balls end up low and away
+    zone_mix = rng.dirichlet(np.full(len(ZONES), 2.0), size=len(types))
+    in_zone_rate = rng.uniform(0.4, 0.55, size=len(types))
+    zone_mix[:, :9] *= (in_zone_rate / zone_mix[:, :9].sum(axis=1))[:, np.newaxis]
+    zone_mix[:, 9:] *= ((1 - in_zone_rate) / zone_mix[:, 9:].sum(axis=1))[:, np.newaxis]
+
+    columns = {name: [] for name in ['ab', 'pitch_type', 'zone', 'description', 'events', 'balls', 'strikes']}
+    # Every at-bat is played to its end, in rounds of at-bats until there are enough pitches
+    at_bats = 0
+    total = 0
+    while total < rows:
+        first, at_bats = at_bats, at_bats + rows // 3 + 1
+        balls = np.zeros(at_bats - first, dtype=np.int64)
+        strikes = np.zeros(at_bats - first, dtype=np.int64)
+        active = np.arange(at_bats - first)
+        while len(active):
+            n = len(active)
+            b, s = balls[active], strikes[active]
+            t = rng.choice(len(types), size=n, p=mix)
+            zone = ZONES[(zone_mix[t].cumsum(axis=1) < rng.random((n, 1))).sum(axis=1).clip(max=len(ZONES) - 1)]
+            in_zone = zone < 10
+
+            # batters swing more at strikes and with two strikes, less when ahead in the count
+            swing = rng.random(n) < np.where(in_zone, 0.66, 0.29) + 0.08*(s == 2) - 0.1*(b == 3)*(s < 2)
+            u = rng.random(n)
+            whiff = swing & (u < np.where(in_zone, 0.15, 0.35))
+            foul = swing & ~whiff & (u < np.where(in_zone, 0.55, 0.65))
+            in_play = swing & ~whiff & ~foul
+            called = ~swing & (rng.random(n) < np.where(in_zone, 0.86, 0.07))
+            hbp = ~swing & ~called & (rng.random(n) < 0.01)
+            ball = ~swing & ~called & ~hbp
+            hit = in_play & (rng.random(n) < 0.32)
+
+            description = np.select([whiff, foul, in_play, called, hbp],
+                                    ['swinging_strike', 'foul', 'hit_into_play', 'called_strike', 'hit_by_pitch'], 'ball')
+            events = np.full(n, None, dtype=object)
+            events[hit] = rng.choice(HITS, size=hit.sum(), p=HIT_MIX)
+            outs = in_play & ~hit
+            events[outs] = rng.choice(OUTS, size=outs.sum(), p=OUT_MIX)
+            strikeout = (whiff | called) & (s == 2)
+            walk = ball & (b == 3)
+            events[strikeout] = 'strikeout'
+            events[walk] = 'walk'
+            events[hbp] = 'hit_by_pitch'
+
+            for name, values in [('ab', first + active), ('pitch_type', types[t]), ('zone', zone.astype(float)),
+                                 ('description', description), ('events', events), ('balls', b), ('strikes', s)]:
+                columns[name].append(values)
+            total += n
+
+            balls[active] += ball
+            strikes[active] += (whiff | called | (foul & (s < 2)))
+            active = active[~(in_play | strikeout | walk | hbp)]
+
+    # Keep whole at-bats, as many as fit in rows
+    d = pd.DataFrame({name: np.concatenate(values) for name, values in columns.items()})
+    d = d.iloc[np.argsort(d['ab'].to_numpy(), kind='stable')]
+    ab = d['ab'].to_numpy()
+    ends = np.flatnonzero(np.append(ab[1:] != ab[:-1], True)) + 1
+    d = d.iloc[:ends[ends <= rows].max(initial=0)]
+    kept = int(d['ab'].iloc[-1]) + 1 if len(d) else 1
+    d['game_date'] = pd.Timestamp(start_dt) + pd.to_timedelta(d['ab'].to_numpy() * days // kept, unit='D')
+    return d.drop(columns='ab').iloc[::-1].reset_index(drop=True)
+
+def player(rows=3000, seed=1):
+    # One pitcher's season: a handful of pitch types from the league mix
+    rng = np.random.default_rng(seed)
+    pitch_types = list(rng.choice(PITCH_TYPES, size=rng.integers(3, 6), replace=False, p=PITCH_MIX))
+    return statcast(rows, seed, pitch_types)
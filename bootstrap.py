@@ -0,0 +1,92 @@
+import argparse
+import numpy as np
+import load_statcast
+from model_store import league_model
+from player_cache import PlayerCache
+from player_index import PlayerIndex
+from qlearning import blend_sparse, expected_reward, obs_arrays
+from transitions import count_transitions
+
+# How stable is a recommended pitch? Every replicate resamples the pitcher's and batter's
+# pitches (and optionally the league table), blends them into the model like model_based_q
+# does, and all replicates are solved together as one stacked (B, S, A) value iteration.
+
+def resample_weights(n, B, rng):
+    # Multinomial bootstrap: how often each of the n observations is drawn in each replicate
+    if n == 0:
+        return np.zeros((B, 0))
+    return rng.multinomial(n, np.full(n, 1/n), size=B)
+
+def resample_league(p, B, rng):
+    # Parametric bootstrap of the league table: redraw the raw counters of every cell from its
+    # estimated probabilities and recompute them the way get_probabilities does (+1 smoothing).
+    # Returns a count_transitions model with B leading replicates.
+    has = p.has_data
+    n = np.rint(p.totals[has] - 1).astype(np.int64)
+    sw, wh, ht, st, fo = (p.probs[col][has] for col in ['Swing %', 'Whiff %', 'Hit Prob', 'Strike Prob', 'Foul %'])
+
+    swings = rng.binomial(n, sw, size=(B, len(n)))
+    split = np.stack([wh, ht, fo], axis=-1)
+    split /= np.maximum(split.sum(axis=-1, keepdims=True), 1)
+    split = np.concatenate([split, 1 - split.sum(axis=-1, keepdims=True)], axis=-1).clip(0, 1)
+    whiffs, hits, fouls, _ = np.moveaxis(rng.multinomial(swings, split), -1, 0)
+    strikes = rng.binomial(n - swings, st)
+
+    columns = [(swings + 1)/(n + 1), (whiffs + 1)/(swings + 1), (hits + 1)/(swings + 1),
+               (strikes + 1)/(n - swings + 1), (fouls + 1)/(swings + 1)]
+    grids = []
+    for values in columns:
+        grid = np.full((B,) + has.shape, np.nan)
+        grid[:, has] = values
+        grids.append(grid)
+    return count_transitions(*grids, has)
+
+def bootstrap_q(model, p, obs_list, B=200, prior_weight=20, gamma=1, league=False, seed=0):
+    # obs_list holds get_obs frames blended in order (pitcher, then batter), each resampled
+    # independently. Returns Q for every replicate, shape (B, 16, A).
+    rng = np.random.default_rng(seed)
+    T = resample_league(p, B, rng) if league else p.get_sparse_T()
+    for obs in obs_list:
+        s, a, r, sp = obs_arrays(obs)
+        T = blend_sparse(T, s, a, sp, prior_weight, p.has_data, resample_weights(len(s), B, rng))
+    R = expected_reward(T, model.R_s)
+    U = model.value_iteration(gamma, T=T, R=R)
+    return model.backup(U, gamma, T, R)
+
+def summarize(Q, mask, alpha=0.1):
+    # Per count: the (alpha/2, 1 - alpha/2) quantiles and mean of Q over the replicates, and the
+    # share of replicates in which each action is the best one in the arsenal (mask)
+    Q = Q[:, :12]
+    B = Q.shape[0]
+    low, high = np.quantile(Q, [alpha/2, 1 - alpha/2], axis=0)
+    best = np.argmax(np.where(mask, Q, -np.inf), axis=-1)
+    wins = np.zeros(Q.shape[1:])
+    np.add.at(wins, (np.broadcast_to(np.arange(12), best.shape), best), 1)
+    return {'low': low, 'high': high, 'mean': Q.mean(axis=0), 'wins': wins / B}
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap intervals for a matchup's recommended pitches")
+    parser.add_argument('--pitcher', required=True, help="pitcher name or MLBAM id")
+    parser.add_argument('--batter', required=True, help="batter name or MLBAM id")
+    parser.add_argument('-B', type=int, default=200, help="number of bootstrap replicates")
+    parser.add_argument('--league', action='store_true', help="also resample the league table")
+    parser.add_argument('--alpha', type=float, default=0.1)
+    parser.add_argument('--gamma', type=float, default=0.99)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    p, model, Q, U_rand = league_model()
+    data = load_statcast.get_matchup_data(args.pitcher, args.batter, PlayerIndex.from_register(), PlayerCache())
+    arsenal = list(data['pitcher']['pitch_type'].drop_duplicates())
+
+    Qb = bootstrap_q(model, p, [p.get_obs(data['pitcher']), p.get_obs(data['batter'])], args.B,
+                     gamma=args.gamma, league=args.league, seed=args.seed)
+    summary = summarize(Qb, p.actions.mask(arsenal), args.alpha)
+    for s, count in enumerate(p.state_lookup):
+        a = int(np.argmax(summary['wins'][s]))
+        pitch_type, zone = p.actions[a]
+        print(f"{count}: {p.pitches.get(pitch_type, pitch_type)}, Zone {zone}  best in {summary['wins'][s, a]:.0%} "
+              f"of replicates, Q in [{summary['low'][s, a]:.3f}, {summary['high'][s, a]:.3f}]")
+
+if __name__ == '__main__':
+    main()
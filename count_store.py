@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+import load_statcast
+
+COUNTERS = ['totals', 'swings', 'whiffs', 'strikes', 'hits', 'fouls']
+
+class CountStore:
+    # On-disk store of the raw (count, pitch_type, zone) counters from load_statcast.aggregate_counts,
+    # one npz partition per game date. The counters are additive, so a refresh only has to
+    # fetch and aggregate the days that are missing before the partitions are merged.
+    # Statcast keeps correcting a day's pitches for a while after the games, so the last
+    # settle_days finished days are not stored either and get fetched again on every update.
+    def __init__(self, path='statcast_counts', settle_days=2):
+        self.path = path
+        self.settle_days = settle_days
+        os.makedirs(path, exist_ok=True)
+
+    def partition_path(self, day):
+        return os.path.join(self.path, day.strftime('%Y-%m-%d') + '.npz')
+
+    def has(self, day):
+        return os.path.exists(self.partition_path(day))
+
+    def save(self, day, counts):
+        index = counts.index
+        path = self.partition_path(day)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f,
+                     count=np.asarray(index.get_level_values(0), dtype=np.int64),
+                     pitch_type=np.asarray(index.get_level_values(1), dtype=str),
+                     zone=np.asarray(index.get_level_values(2), dtype=np.float64),
+                     **{c: counts[c].to_numpy(dtype=np.int64) for c in COUNTERS})
+        os.replace(path + '.tmp', path)
+
+    def load(self, day):
+        with np.load(self.partition_path(day)) as z:
+            index = pd.MultiIndex.from_arrays([z['count'], z['pitch_type'].astype(object), z['zone']],
+                                              names=['count', 'pitch_type', 'zone'])
+            return pd.DataFrame({c: z[c] for c in COUNTERS}, index=index)
+
+    def missing_days(self, start_dt, end_dt):
+        return [day for day in pd.date_range(start_dt, end_dt) if not self.has(day)]
+
+    def update(self, start_dt, end_dt, fetcher=load_statcast.fetch_statcast, chunk_days=None):
+        # Fetch the missing days in contiguous runs (at most chunk_days long, so a multi-season
+        # backfill never holds more than one chunk of pitches), store one partition per day and
+        # return the merged counters for the whole range. Days from settle_days before today on
+        # are never stored since their data may still change; they are fetched again on the next update.
+        settled = pd.Timestamp.today().normalize() - pd.Timedelta(days=self.settle_days)
+        fresh = {}
+        for run in self._runs(self.missing_days(start_dt, end_dt), chunk_days):
+            d = fetcher(run[0].strftime('%Y-%m-%d'), run[-1].strftime('%Y-%m-%d'))
+            by_day = {}
+            if d is not None and len(d):
+                by_day = dict(tuple(d.groupby(pd.to_datetime(d['game_date']).dt.normalize())))
+
+            for day in run:
+                counts = load_statcast.aggregate_counts(by_day.get(day, pd.DataFrame(columns=load_statcast.COLUMNS)))
+                if day < settled:
+                    self.save(day, counts)
+                else:
+                    fresh[day] = counts
+            del d, by_day
+
+        days = pd.date_range(start_dt, end_dt)[::-1]
+        return load_statcast.merge_counts([fresh[day] if day in fresh else self.load(day) for day in days])
+
+    def _runs(self, days, chunk_days=None):
+        runs = []
+        for day in days:
+            if runs and day - runs[-1][-1] == pd.Timedelta(days=1) and (chunk_days is None or len(runs[-1]) < chunk_days):
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+        return runs
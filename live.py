@@ -0,0 +1,96 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import load_statcast
+from model_store import league_model
+from player_cache import PlayerCache
+from player_index import PlayerIndex
+from qlearning import q_learn
+
+# In-game mode: pitches are fed in one at a time as they happen, each one is applied to the
+# matchup Q as a single TD update (same transition rules and rewards as get_obs and QLearn),
+# and the best arsenal pitch for the new count comes straight back.
+
+class AtBatSession:
+    def __init__(self, p, Q, arsenal, eta=0.01, gamma=0.99):
+        self.p = p
+        self.Q = np.array(Q, dtype=np.float64)
+        self.mask = p.actions.mask(arsenal)
+        self.eta = eta
+        self.gamma = gamma
+        self.state = 0 # count the next pitch is thrown in, 0-0 at the start of every at-bat
+        self.updates = 0
+        self.skipped = 0
+        self.latencies = []
+
+    def recommend(self, state=None):
+        s = self.state if state is None else state
+        return self.p.actions[int(np.argmax(np.where(self.mask, self.Q[s], -np.inf)))]
+
+    def pitch(self, pitch_type, zone, balls, strikes, description, events=None):
+        # One pitch in the columns get_pitcher_data returns. Returns the recommendation for the
+        # count after it (0-0 again once the at-bat is over).
+        start = time.perf_counter()
+        s, a, r, sp, known, matched = self.p.encode([pitch_type], [zone], [balls], [strikes], [description], [events])
+        s, a, r, sp = int(s[0]), int(a[0]), float(r[0]), int(sp[0])
+        if known[0] and matched[0]:
+            row = self.Q[s]
+            row[a] += self.eta*(r + self.gamma*self.Q[sp].max() - row[a])
+            self.updates += 1
+        else:
+            self.skipped += 1
+        # Resync to the count the pitch was thrown in, so a missed or unclassified pitch (a pitchout,
+        # an automatic ball) can't leave the session on a stale count, then advance past it
+        if balls in range(4) and strikes in range(3):
+            self.state = s
+        if matched[0]:
+            self.state = 0 if sp >= len(self.p.state_lookup) else sp
+        elif isinstance(events, str):
+            # the at-bat ended on an event get_obs doesn't classify
+            self.state = 0
+        recommendation = self.recommend()
+        self.latencies.append(time.perf_counter() - start)
+        return recommendation
+
+    def replay(self, log):
+        # Feeds a recorded log (a frame with the six columns, in the order the pitches were thrown)
+        # through pitch() and returns (count state, recommendation) after each one
+        steps = []
+        for row in log[load_statcast.COLUMNS].itertuples(index=False):
+            recommendation = self.pitch(row.pitch_type, row.zone, row.balls, row.strikes, row.description, row.events)
+            steps.append((self.state, recommendation))
+        return steps
+
+    def latency(self):
+        # p50, p95 and max update latency in milliseconds
+        if not self.latencies:
+            return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        ms = np.array(self.latencies)*1000
+        return {'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)), 'max': float(ms.max())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a game log pitch by pitch with live recommendations")
+    parser.add_argument('--pitcher', required=True, help="pitcher name or MLBAM id")
+    parser.add_argument('--batter', required=True, help="batter name or MLBAM id")
+    parser.add_argument('--log', required=True, help="csv with the pitch_type, zone, events, description, balls, strikes "
+                                                     "columns, oldest pitch first")
+    parser.add_argument('--eta', type=float, default=0.01)
+    parser.add_argument('--gamma', type=float, default=0.99)
+    args = parser.parse_args()
+
+    p, model, Q, U_rand = league_model()
+    data = load_statcast.get_matchup_data(args.pitcher, args.batter, PlayerIndex.from_register(), PlayerCache())
+    arsenal = list(data['pitcher']['pitch_type'].drop_duplicates())
+    Qp = q_learn(p.get_obs(data['pitcher']), args.eta, args.gamma, Q)
+    Qb = q_learn(p.get_obs(data['batter']), args.eta, args.gamma, Qp)
+
+    session = AtBatSession(p, Qb, arsenal, args.eta, args.gamma)
+    states = list(p.state_lookup)
+    steps = [(session.state, session.recommend())] + session.replay(pd.read_csv(args.log))
+    for state, (pitch_type, zone) in steps:
+        print(f"{states[state]}: {p.pitches.get(pitch_type, pitch_type)}, Zone {zone}")
+    print(f"{session.updates} updates, {session.skipped} skipped, latency {session.latency()}")
+
+if __name__ == '__main__':
+    main()
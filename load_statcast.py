@@ -1,84 +1,128 @@
-import pybaseball
-from pybaseball import statcast_pitcher, statcast, playerid_lookup, statcast_batter
 import math
 import pandas as pd
 import numpy as np
 import pitch_perfect
 
-def retrieve_data():
+START_DT = '2024-04-01'
+END_DT = '2024-10-01'
+COLUMNS = ['pitch_type','zone', 'events', 'description', 'balls', 'strikes']
+
+def fetch_statcast(start_dt, end_dt):
+  # pybaseball is only imported once something actually has to be downloaded
+  import pybaseball
+  from pybaseball import statcast
   pybaseball.cache.enable()
-  d = statcast('2024-04-1', '2024-10-1', verbose = False)
-  d = d[['pitch_type','zone', 'events', 'description', 'balls', 'strikes']]
-
-  d00 = d[(d['balls']== 0) & (d['strikes']==0)][['pitch_type','zone', 'events', 'description']]
-  d01 = d[(d['balls']== 0) & (d['strikes']==1)][['pitch_type','zone', 'events', 'description']]
-  d02 = d[(d['balls']== 0) & (d['strikes']==2)][['pitch_type','zone', 'events', 'description']]
-  d10 = d[(d['balls']== 1) & (d['strikes']==0)][['pitch_type','zone', 'events', 'description']]
-  d11 = d[(d['balls']== 1) & (d['strikes']==1)][['pitch_type','zone', 'events', 'description']]
-  d12 = d[(d['balls']== 1) & (d['strikes']==2)][['pitch_type','zone', 'events', 'description']]
-  d20 = d[(d['balls']== 2) & (d['strikes']==0)][['pitch_type','zone', 'events', 'description']]
-  d21 = d[(d['balls']== 2) & (d['strikes']==1)][['pitch_type','zone', 'events', 'description']]
-  d22 = d[(d['balls']== 2) & (d['strikes']==2)][['pitch_type','zone', 'events', 'description']]
-  d30 = d[(d['balls']== 3) & (d['strikes']==0)][['pitch_type','zone', 'events', 'description']]
-  d31 = d[(d['balls']== 3) & (d['strikes']==1)][['pitch_type','zone', 'events', 'description']]
-  d32 = d[(d['balls']== 3) & (d['strikes']==2)][['pitch_type','zone', 'events', 'description']]
-  d_split = [d00, d01, d02, d10, d11, d12, d20, d21, d22, d30, d31, d32]
-
-  totals = {}
-  swings = {}
-  whiffs = {}
-  strikes = {}
-  hits = {}
-  fouls = {}
-
-  for i in range(len(d_split)):
-    for idx,pitch in d_split[i].iterrows():
-      # Initialize all counts with 1 to avoid divide by zero
-      if (i, pitch['pitch_type'], pitch['zone']) not in totals:
-        totals[(i, pitch['pitch_type'], pitch['zone'])] = 1
-        swings[(i, pitch['pitch_type'], pitch['zone'])] = 1
-        whiffs[(i, pitch['pitch_type'], pitch['zone'])] = 1
-        strikes[(i, pitch['pitch_type'], pitch['zone'])] = 1
-        hits[(i, pitch['pitch_type'], pitch['zone'])] = 1
-        fouls[(i, pitch['pitch_type'], pitch['zone'])] = 1
-
-      totals[(i, pitch['pitch_type'], pitch['zone'])] += 1
-      if pitch['description'] in ['swinging_strike', 'hit_into_play', 'foul']:
-        swings[(i, pitch['pitch_type'], pitch['zone'])] += 1
-      if pitch['description'] == 'swinging_strike':
-        whiffs[(i, pitch['pitch_type'], pitch['zone'])] += 1
-      if pitch['description'] == 'called_strike':
-        strikes[(i, pitch['pitch_type'], pitch['zone'])] += 1
-      if pitch['events'] in ['single', 'double', 'triple', 'home_run']:
-        hits[(i, pitch['pitch_type'], pitch['zone'])] += 1
-      if pitch['description'] == 'foul':
-        fouls[(i, pitch['pitch_type'], pitch['zone'])] += 1
-
-  pswing = {k: float(swings[k])/totals[k] for k in swings}
-  pwhiff = {k: float(whiffs[k])/swings[k] for k in whiffs}
-  phit = {k: float(hits[k])/swings[k] for k in hits}
-  pfoul = {k: float(fouls[k])/swings[k] for k in fouls}
-  pstrike = {k: float(strikes[k])/(totals[k] - swings[k] + 1) for k in fouls}
+  return statcast(start_dt, end_dt, verbose = False)
+
+def retrieve_data(start_dt=START_DT, end_dt=END_DT, store=None, fetcher=fetch_statcast, chunk_days=None):
+  # With a CountStore only the days it hasn't seen yet are fetched and aggregated
+  if store is not None:
+    return get_probabilities(store.update(start_dt, end_dt, fetcher, chunk_days=chunk_days))
+
+  # Streaming mode keeps only one chunk of pitches in memory at a time
+  if chunk_days is not None:
+    return get_probabilities(stream_counts(start_dt, end_dt, fetcher, chunk_days))
+
+  d = fetcher(start_dt, end_dt)
+  return get_probabilities(aggregate_counts(d))
+
+def date_chunks(start_dt, end_dt, chunk_days):
+  # (start, end) date strings covering the range in chunks of chunk_days, newest chunk first
+  days = pd.date_range(start_dt, end_dt)
+  chunks = [days[i:i + chunk_days] for i in range(0, len(days), chunk_days)]
+  return [(c[0].strftime('%Y-%m-%d'), c[-1].strftime('%Y-%m-%d')) for c in reversed(chunks)]
+
+def stream_counts(start_dt, end_dt, fetcher=fetch_statcast, chunk_days=7):
+  # Fold each chunk into running counters and drop it before the next one is loaded.
+  # Chunks go newest first so the merged rows keep the order of a single full-range pull.
+  counts = aggregate_counts(pd.DataFrame(columns=COLUMNS))
+  for chunk_start, chunk_end in date_chunks(start_dt, end_dt, chunk_days):
+    d = fetcher(chunk_start, chunk_end)
+    if d is not None and len(d):
+      counts = merge_counts([counts, aggregate_counts(d[COLUMNS])])
+    del d
+  return counts
+
+def aggregate_counts(d):
+  # Raw counters for every (count, pitch_type, zone) in one grouped pass. The counters are
+  # additive across any split of the pitches, the +1 smoothing is applied in get_probabilities.
+  # Count index i follows state_lookup: 0-0 -> 0, 0-1 -> 1, ..., 3-2 -> 11
+  # Pitches with no pitch_type or zone are dropped by the groupby. The old iterrows loop kept one
+  # cell per such pitch (NaN keys never matched), but none of them could be an action.
+  d = d[d['balls'].isin(range(4)) & d['strikes'].isin(range(3))]
+  counts = pd.DataFrame({
+      'count': (d['balls']*3 + d['strikes']).astype('int64'),
+      'pitch_type': d['pitch_type'],
+      'zone': d['zone'],
+      'totals': 1,
+      'swings': d['description'].isin(['swinging_strike', 'hit_into_play', 'foul']),
+      'whiffs': d['description'] == 'swinging_strike',
+      'strikes': d['description'] == 'called_strike',
+      'hits': d['events'].isin(['single', 'double', 'triple', 'home_run']),
+      'fouls': d['description'] == 'foul'
+  })
+  counts = counts.groupby(['count', 'pitch_type', 'zone'], sort=False, observed=True).sum()
+
+  # Keep rows in order of first appearance within each count, like the original per-count loop
+  order = np.argsort(counts.index.get_level_values(0), kind='stable')
+  return counts.iloc[order].astype('int64')
+
+def merge_counts(frames):
+  # Sum counters from several aggregate_counts frames. Frames should be passed newest first,
+  # which is how statcast orders a multi-day pull, so first-appearance order is preserved.
+  frames = [f for f in frames if len(f)]
+  if not frames:
+    return aggregate_counts(pd.DataFrame(columns=COLUMNS))
+  counts = pd.concat(frames).groupby(level=[0, 1, 2], sort=False).sum()
+  order = np.argsort(counts.index.get_level_values(0), kind='stable')
+  return counts.iloc[order]
+
+def get_probabilities(counts):
+  # Initialize all counts with 1 to avoid divide by zero
+  c = counts + 1
 
   d_all = pd.DataFrame({
-      'Count': pd.Series(totals),
-      'Swing %': pd.Series(pswing), # Probability that batter swings at pitch
-      'Whiff %': pd.Series(pwhiff), # Probability that batter misses given that they swung
-      'Hit Prob': pd.Series(phit), # Probability of hit given that batter swings
-      'Strike Prob': pd.Series(pstrike), # Probability of strike given the batter takes pitch
-      'Foul %': pd.Series(pfoul) # Probability of foul ball given that batter swings
+      'Count': c['totals'],
+      'Swing %': c['swings']/c['totals'], # Probability that batter swings at pitch
+      'Whiff %': c['whiffs']/c['swings'], # Probability that batter misses given that they swung
+      'Hit Prob': c['hits']/c['swings'], # Probability of hit given that batter swings
+      'Strike Prob': c['strikes']/(c['totals'] - c['swings'] + 1), # Probability of strike given the batter takes pitch
+      'Foul %': c['fouls']/c['swings'] # Probability of foul ball given that batter swings
   })
+  d_all = d_all.rename_axis([None, None, None])
 
   d_all = d_all[d_all.Count > 30] # Keep only pitches with more than 30 observations over the season
-  d_all.sort_index() # Probabilities for each count by pitch
-  return d_all
-
-def get_pitcher_data(last, first):
-    id = playerid_lookup(last, first, fuzzy=True)['key_mlbam'][0]
-    data = statcast_pitcher('2024-04-1', '2024-10-1', id)[['pitch_type','zone', 'events', 'description', 'balls', 'strikes']]
-    return data[data['pitch_type'].notna()]
-
-def get_batter_data(last, first):
-  id = playerid_lookup(last, first, fuzzy=True)['key_mlbam'][0]
-  data = statcast_batter('2024-04-1', '2024-10-1', id)[['pitch_type','zone', 'events', 'description', 'balls', 'strikes']]
-  return data[data['pitch_type'].notna()]
\ No newline at end of file
+  return d_all # Probabilities for each count by pitch
+
+def fetch_player(role, player_id, start_dt, end_dt):
+  import pybaseball
+  from pybaseball import statcast_pitcher, statcast_batter
+  pybaseball.cache.enable()
+  if role == 'pitcher':
+    return statcast_pitcher(start_dt, end_dt, player_id)
+  return statcast_batter(start_dt, end_dt, player_id)
+
+def get_player_data(role, player_id, cache=None, start_dt=START_DT, end_dt=END_DT):
+  # With a PlayerCache the pitches come from disk when possible
+  if cache is not None:
+    return cache.get(role, player_id, start_dt, end_dt)
+  data = fetch_player(role, player_id, start_dt, end_dt)[COLUMNS]
+  return data[data['pitch_type'].notna()]
+
+def get_matchup_data(pitcher, batter, index, cache=None):
+  # Pitches for a pitcher and a batter given by name or MLBAM id, as {'pitcher': ..., 'batter': ...}
+  return {role: get_player_data(role, index.player_id(name), cache=cache)
+          for role, name in [('pitcher', pitcher), ('batter', batter)]}
+
+def lookup_id(last, first, index=None):
+  # A PlayerIndex resolves names in process; otherwise fall back to pybaseball's fuzzy lookup
+  if index is not None:
+    return index.resolve(f"{first} {last}")
+  from pybaseball import playerid_lookup
+  return playerid_lookup(last, first, fuzzy=True)['key_mlbam'][0]
+
+def get_pitcher_data(last, first, cache=None, index=None):
+  return get_player_data('pitcher', lookup_id(last, first, index), cache)
+
+def get_batter_data(last, first, cache=None, index=None):
+  return get_player_data('batter', lookup_id(last, first, index), cache)
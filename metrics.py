@@ -0,0 +1,100 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import numpy as np
+
+# Per-stage timings for the app. span() times a block, logs it as one JSON line on the
+# 'metrics' logger and keeps the last samples per stage for p50/p95. Cache hit counters are
+# read from the caches themselves through gauges. Profiling is opt-in: after arm_profile()
+# requests run under cProfile until one is slow enough, and that one's profile is saved.
+
+logger = logging.getLogger('metrics')
+
+class Metrics:
+    def __init__(self, samples=1000):
+        self.samples = samples
+        self.timings = defaultdict(lambda: deque(maxlen=self.samples))
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.profile_min_ms = None
+        self.profile_path = 'profiles'
+
+    @contextmanager
+    def span(self, stage, **fields):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            ms = (time.perf_counter() - start)*1000
+            with self.lock:
+                self.timings[stage].append(ms)
+            record = {'stage': stage, 'ms': round(ms, 3), **fields}
+            if error:
+                record['error'] = error
+            logger.info(json.dumps(record, default=str))
+
+    def gauge(self, name, fn):
+        # fn() is called when a summary is taken, e.g. a cache's stats()
+        self.gauges[name] = fn
+
+    def summary(self):
+        with self.lock:
+            timings = {stage: np.array(samples) for stage, samples in self.timings.items()}
+        stages = {stage: {'count': len(ms), 'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)),
+                          'max': float(ms.max())} for stage, ms in timings.items() if len(ms)}
+        return {'stages': stages, 'gauges': {name: fn() for name, fn in self.gauges.items()}}
+
+    def arm_profile(self, min_ms=0):
+        # Profile requests until one takes at least min_ms, then save that profile and stop
+        self.profile_min_ms = min_ms
+
+    @contextmanager
+    def profiled(self, name):
+        # Wraps one request. Does nothing unless a profile was armed, so the usual cost is one check.
+        # Only the calling thread is profiled: work on the fetch and train pools shows up as time
+        # spent waiting on their futures, which the spans break down.
+        min_ms = self.profile_min_ms
+        if min_ms is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            ms = (time.perf_counter() - start)*1000
+            if ms >= min_ms:
+                self.profile_min_ms = None
+                self.save_profile(profile, name, ms)
+
+    def save_profile(self, profile, name, ms):
+        os.makedirs(self.profile_path, exist_ok=True)
+        path = os.path.join(self.profile_path, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}.prof")
+        profile.dump_stats(path)
+        top = io.StringIO()
+        pstats.Stats(profile, stream=top).sort_stats('cumulative').print_stats(15)
+        logger.info(json.dumps({'profile': path, 'request': name, 'ms': round(ms, 3)}))
+        logger.info(top.getvalue())
+
+def setup_logging(path=None):
+    # Metrics lines go to stderr, or to path when given, without touching other loggers
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+registry = Metrics()
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import load_statcast
+from count_store import CountStore
+from pitch_perfect import PitchPerfect
+from qlearning import QLearning
+
+MODEL_VERSION = 2
+SOURCES = ['load_statcast.py', 'action_registry.py', 'pitch_perfect.py', 'qlearning.py']
+ARRAYS = ['T', 'R', 'U', 'Q', 'U_rand']
+
+def model_key(start_dt, end_dt):
+    # Identifies the league data range and the code that trained on it, so a snapshot made by
+    # an older version of the pipeline or for another range is never restored
+    h = hashlib.sha256(f'{MODEL_VERSION}:{start_dt}:{end_dt}'.encode())
+    for name in SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def save_model(path, key, data, actions, **arrays):
+    # Each array goes to its own .npy so it can be memory-mapped on load. The manifest is
+    # written last, so a partially written snapshot is never picked up.
+    os.makedirs(path, exist_ok=True)
+    index = data.index
+    arrays['data_count'] = np.asarray(index.get_level_values(0), dtype=np.int64)
+    arrays['data_pitch_type'] = np.asarray(index.get_level_values(1), dtype=str)
+    arrays['data_zone'] = np.asarray(index.get_level_values(2), dtype=np.float64)
+    arrays['data_values'] = data.to_numpy(dtype=np.float64)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+
+    manifest = {
+        'key': key,
+        'version': MODEL_VERSION,
+        'columns': list(data.columns),
+        'actions': [[pitch_type, int(zone)] for pitch_type, zone in actions]
+    }
+    with open(os.path.join(path, 'manifest.json.tmp'), 'w') as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(path, 'manifest.json.tmp'), os.path.join(path, 'manifest.json'))
+
+def load_model(path, key):
+    # Returns None when there is no snapshot or it was made from other data or code
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('key') != key:
+        return None
+
+    model = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ARRAYS}
+    index = pd.MultiIndex.from_arrays([np.load(os.path.join(path, 'data_count.npy')),
+                                       np.load(os.path.join(path, 'data_pitch_type.npy')).astype(object),
+                                       np.load(os.path.join(path, 'data_zone.npy'))])
+    data = pd.DataFrame(np.load(os.path.join(path, 'data_values.npy')), index=index, columns=manifest['columns'])
+    model['data'] = data.astype({'Count': np.int64})
+    model['actions'] = [tuple(action) for action in manifest['actions']]
+    return model
+
+def league_model(path='model', start_dt=load_statcast.START_DT, end_dt=load_statcast.END_DT):
+    # Restore the league model from its snapshot, or train it and save a new snapshot.
+    # Returns (PitchPerfect, QLearning, Q, U_rand).
+    key = model_key(start_dt, end_dt)
+    snapshot = load_model(path, key)
+    if snapshot is not None:
+        p = PitchPerfect(snapshot['data'], T=snapshot['T'])
+        # T and Q are laid out on the saved action order, which has to match the rebuilt registry
+        if snapshot['actions'] == list(p.actions):
+            print("Restoring trained league model")
+            return p, QLearning(p), snapshot['Q'], snapshot['U_rand']
+        print("Saved league model has a different action set, retraining")
+
+    print("Retrieving all statcast data... (only missing days are downloaded)")
+    data = load_statcast.retrieve_data(start_dt, end_dt, store=CountStore())
+    print("Creating models")
+    p = PitchPerfect(data)
+    model = QLearning(p)
+    print("Initializing Q learning")
+    Q, U_rand = model.initialize_q()
+    print(f"Value iteration finished after {model.iterations} sweeps (residual {model.residual:.1e})")
+    save_model(path, key, data, p.actions, T=model.T, R=model.R, U=model.U, Q=Q, U_rand=U_rand)
+    return p, model, Q, U_rand
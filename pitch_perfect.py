@@ -1,105 +1,90 @@
 import pandas as pd
 import numpy as np
+from action_registry import ActionRegistry
+from transitions import count_transitions
+
+def transition_matrix(swing, whiff, hit, strike, foul, has_data):
+  # Builds T[s, a, s'] from the probability columns, given as (..., 16, actions) arrays; any
+  # leading dimensions are carried through to T[..., s, a, s'].
+  T = np.zeros(has_data.shape + (16,))
+  for s in range(12):
+    sw, wh, ht, st, fo = (x[..., s, :] for x in (swing, whiff, hit, strike, foul))
+
+    T[..., s, :, -4] = sw*ht # hit probability
+    T[..., s, :, -3] = sw*(1-ht-wh-fo) # out probability
+    if s >= 9:
+      T[..., s, :, -2] = (1-sw)*(1-st) # walk probability
+    if (s + 1) % 3 == 0:
+      T[..., s, :, -1] = sw*wh + (1-sw)*st # strikeout probability
+      T[..., s, :, s] = sw*fo # foul probability (only if we already have 2 strikes)
+    else:
+      T[..., s, :, s+1] = (1-sw)*st + sw*(wh+fo) # strike probability
+    if s < 9:
+      T[..., s, :, s+3] = (1-sw)*(1-st) # ball probability
+
+  # if this pitch isn't "allowed" (i.e. not enough data probably)
+  # we set the probability of a HIT to 1 to disincentivize this pitch
+  # (also for the end states)
+  T[~has_data] = 0
+  T[..., -4][~has_data] = 1
+  return T
+
+def zone_pixels():
+  # Zone number of every pixel of the 16x10 heat map: the strike zone (1-9) in the middle, the
+  # four chase zones (11-14) as L-shapes around it
+  pixels = np.zeros((16, 10), dtype=np.int64)
+  for zone, (rows, cols) in enumerate([(slice(2, 6), slice(2, 4)), (slice(2, 6), slice(4, 6)), (slice(2, 6), slice(6, 8)),
+                                       (slice(6, 10), slice(2, 4)), (slice(6, 10), slice(4, 6)), (slice(6, 10), slice(6, 8)),
+                                       (slice(10, 14), slice(2, 4)), (slice(10, 14), slice(4, 6)), (slice(10, 14), slice(6, 8))], 1):
+    pixels[rows, cols] = zone
+  pixels[0:2, 0:5] = pixels[0:8, 0:2] = 11
+  pixels[0:2, 5:] = pixels[0:8, 8:] = 12
+  pixels[8:, 0:2] = pixels[14:, 0:5] = 13
+  pixels[14:, 5:] = pixels[8:, 8:] = 14
+  return pixels
+
+ZONE_PIXELS = zone_pixels()
+
+def isin(x, values):
+  # Elementwise membership for object arrays that may hold None/NaN
+  return np.logical_or.reduce([x == v for v in values])
 
 class PitchPerfect:
-  def __init__(self, data):
+  def __init__(self, data, T=None):
+    # T can be passed in from a saved model snapshot instead of being rebuilt from data
     self.data = data
     self.state_lookup = {'0-0':0, '0-1':1, '0-2':2,'1-0':3, '1-1':4, '1-2':5, '2-0':6, '2-1':7, '2-2':8, '3-0':9, '3-1':10, '3-2':11}
-    self.actions = data.index[0:134].droplevel(0)
+    self.actions = ActionRegistry.from_index(data.index)
     self.pitches = {'FA': 'Fastball', 'FT': 'Two-Seam Fastball', 'FC': 'Cutter', 'FS': 'Splitter', 'SI': 'Sinker', 'SL': 'Slider', 'CU': 'Curveball', 'KC': 'Knuckle Curve', 'EP': 'Eephus', 'CH': 'Changeup', 'SC': 'Screwball', 'KN': 'Knuckleball', 'ST': 'Sweeper', 'SV': 'Slurve', 'FF': 'Four-Seam Fastball'}
 
+    # Probability columns laid out on a dense (state, action) grid, NaN where there is no data
+    A = len(self.actions)
+    grid = data.reindex(pd.MultiIndex.from_tuples([(s, pitch_type, float(zone)) for s in range(16) for pitch_type, zone in self.actions]))
+    self.has_data = grid['Count'].notna().to_numpy().reshape(16, A)
+    self.totals = grid['Count'].to_numpy().reshape(16, A)
+    self.probs = {col: grid[col].to_numpy().reshape(16, A) for col in ['Swing %', 'Whiff %', 'Hit Prob', 'Strike Prob', 'Foul %']}
+
     # pitches where we don't have enough data need to be stored
-    self.not_enough_data = set()
-    for s in range(16):
-      for a in range(134):
-        # s represents our count
-        pitch_type = self.actions[a][0]
-        zone = self.actions[a][1]
-        if (s, pitch_type, zone) not in self.data.index:
-          self.not_enough_data.add((s, pitch_type, zone))    
-
-  def T_hit(self, count, type, zone):
-    # P(hit) = P(hit|swing)*P(swing)
-    return self.data.loc[(count, type, zone)]['Swing %']*self.data.loc[(count, type, zone)]['Hit Prob']
-
-  def T_strikeout(self, count, type, zone):
-    k = (count, type, zone)
-    # If two strikes
-    if (count + 1) % 3 != 0:
-      return 0
-    else:
-      swinging_out = self.data.loc[k]['Swing %']*(self.data.loc[(count, type, zone)]['Whiff %']) # P(swing and miss)
-      taken_out = (1-self.data.loc[(count, type, zone)]['Swing %'])*self.data.loc[(count, type, zone)]['Strike Prob'] # P(take strike 3) = P(strike)*(1-P(swing))
-      return swinging_out + taken_out
-
-  def T_out(self, count, type, zone):
-    # P(swing and not a hit)
-    return self.data.loc[(count, type, zone)]['Swing %']*(1-self.data.loc[(count, type, zone)]['Hit Prob']-self.data.loc[(count, type, zone)]['Whiff %']-self.data.loc[(count, type, zone)]['Foul %'])
-
-  def T_walk(self, count, type, zone):
-    if (count < 9):
-      return 0 # If there aren't any balls, P(walk)=0
-    return (1-self.data.loc[(count, type, zone)]['Swing %'])*(1-self.data.loc[(count, type, zone)]['Strike Prob']) # P(take ball 4)
-
-  def T_foul(self, count, type, zone):
-    k = (count, type, zone)
-    return self.data.loc[k]['Swing %']*(self.data.loc[k]['Foul %']) #P(swing)*P(foul|swing)
-
-  def T_b(self, count, type, zone):
-    if (count >= 9):
-      return 0 # If ball with 3 balls, can't add to ball count
-    return (1-self.data.loc[(count, type, zone)]['Swing %'])*(1-self.data.loc[(count, type, zone)]['Strike Prob']) # P(take ball)
-
-  def T_s(self, count, type, zone):
-    if (count + 1) % 3 == 0:
-      return 0 # If strike with 2 strike, can't add to strike count
-    # P(take strike)+P(foul or whiff)
-    return (1-self.data.loc[(count, type, zone)]['Swing %'])*self.data.loc[(count, type, zone)]['Strike Prob'] + self.data.loc[(count, type, zone)]['Swing %']*(self.data.loc[(count, type, zone)]['Whiff %']+self.data.loc[(count, type, zone)]['Foul %'])
+    self.not_enough_data = {(int(s),) + self.actions[a] for s, a in zip(*np.nonzero(~self.has_data))}
+    self.T = T
+    self.T_sparse = None
 
   def get_T(self):
     # Construct T(s' | s, a) table for all pitch counts
     # Possible states: 0-0, 0-1, 0-2, 1-0, 1-1, 1-2, 2-0, 2-1, 2-2, 3-0, 3-1, 3-2, HIT, OUT, WALK, STRIKEOUT = 16 total states
-    # Possible actions: 134 total (per the block above)
-    # Table will be 16x134x16 but very sparse
-    T = np.zeros((16, 134, 16))
-
-    for s in range(16):
-      for a in range(134):
-        # s represents our count
-        pitch_type = self.actions[a][0]
-        zone = self.actions[a][1]
-
-        # if this pitch isn't "allowed" (i.e. not enough data probably)
-        # we set the probability of a HIT to 1 to disincentivize this pitch
-        # (also for the end states)
-        if (s, pitch_type, zone) not in self.data.index:
-          T[s, a, -4] = 1
-          continue
-
-        # hit probability
-        T[s, a, -4] = self.T_hit(s, pitch_type, zone)
-
-        # out probability
-        T[s, a, -3] = self.T_out(s, pitch_type, zone)
-
-        # walk probability (zero if state < 9)
-        T[s, a, -2] = self.T_walk(s, pitch_type, zone)
-
-        # strikeout probability (zero if state < 9)
-        T[s, a, -1] = self.T_strikeout(s, pitch_type, zone)
-
-        # strike probability (zero if we are already have 2 strikes)
-        if (s + 1) % 3 != 0:
-          T[s, a, s+1] = self.T_s(s, pitch_type, zone)
-
-        # ball probability (zero if we already have 3 balls)
-        if s < 9:
-          T[s, a, s+3] = self.T_b(s, pitch_type, zone)
-
-        # foul probability (only if we already have 2 strikes)
-        if (s + 1) % 3 == 0:
-          T[s, a, s] = self.T_foul(s, pitch_type, zone)
-    return T
+    # Possible actions: every (pitch_type, zone) in self.actions
+    # Table will be 16xAx16 but very sparse. It is built once and shared by get_R and QLearning.
+    if self.T is None:
+      p = self.probs
+      self.T = transition_matrix(p['Swing %'], p['Whiff %'], p['Hit Prob'], p['Strike Prob'], p['Foul %'], self.has_data)
+    return self.T
+
+  def get_sparse_T(self):
+    # Same model as get_T with only the (at most six) reachable successors of each (s, a)
+    if self.T_sparse is None:
+      p = self.probs
+      self.T_sparse = count_transitions(p['Swing %'], p['Whiff %'], p['Hit Prob'], p['Strike Prob'], p['Foul %'], self.has_data)
+    return self.T_sparse
 
   def get_Rs(self):
     # using https://docs.google.com/spreadsheets/d/18iJ9rTnABwFry3Qc_rH9kkoaiC5gWJJgsdQDM6FS_54/edit?gid=0#gid=0
@@ -170,7 +155,7 @@ class PitchPerfect:
     return R_s
 
   def get_R(self):
-    # Build rewards matrix R(s, a) which is 12x134
+    # Build rewards matrix R(s, a) which is 16xA
 
     '''
     Indices for pitch counts:
@@ -192,149 +177,80 @@ class PitchPerfect:
     15: STRIKEOUT
     '''
     R_s = self.get_Rs()
-    
-    R_sas = np.tile(np.expand_dims(R_s, axis=1), (1, 134, 1))
 
     # To get R(s, a), we multiply by the transition probabilities and sum over the s' axis
-
-    R = np.sum(R_sas * self.get_T(), axis=2)
+    R = np.sum(R_s[:, np.newaxis, :] * self.get_T(), axis=2)
     return R
 
-  def get_obs(self, data):
-    s_obs = []
-    a_obs = []
-    r_obs = []
-    sp_obs = []
+  def encode(self, pitch_type, zone, balls, strikes, description, events):
+    # Column-wise version of the get_obs transition rules, checked in the same order as before.
+    # Returns (s, a, r, sp) arrays plus two masks: rows whose (pitch_type, zone) is a known
+    # action and rows whose outcome matched one of the rules. r and sp are only valid where both hold.
+    a = self.actions.lookup(pitch_type, zone)
+    balls = pd.Series(balls).astype('float64').to_numpy()
+    strikes = pd.Series(strikes).astype('float64').to_numpy()
+    description = np.asarray(description, dtype=object)
+    events = np.asarray(events, dtype=object)
+
+    in_count = np.isin(balls, range(4)) & np.isin(strikes, range(3))
+    s = np.where(in_count, balls*3 + strikes, 0).astype(np.int64)
+    two_strikes = strikes == 2
+
+    rules = [
+      (description == 'hit_into_play', np.where(events == 'field_out', 13, 12)),
+      (isin(events, ['strikeout', 'strikeout_double_play']), 15),
+      (isin(events, ['walk', 'hit_by_pitch']), 14),
+      (isin(description, ['called_strike', 'swinging_strike', 'missed_bunt']), np.where(two_strikes, -1, s+1)),
+      (description == 'swinging_strike_blocked', np.where(two_strikes, 15, s+1)),
+      (isin(description, ['foul', 'foul_tip', 'foul_bunt']), np.where(two_strikes, s, s+1)),
+      (isin(description, ['ball', 'blocked_ball']), np.where(balls == 3, -1, s+3))
+    ]
+    sp = np.select([rule for rule, _ in rules], [target for _, target in rules], default=-1)
+
+    known = a >= 0
+    matched = in_count & (sp >= 0)
+    r = self.get_Rs()[s, np.where(matched, sp, 0)]
+    return s, a, r, sp, known, matched
 
-    R_s = self.get_Rs()
+  def get_obs(self, data):
+    s, a, r, sp, known, matched = self.encode(data['pitch_type'], data['zone'], data['balls'], data['strikes'],
+                                              data['description'], data['events'])
 
-    for _,row in data.iterrows():
-      if (row['pitch_type'], row['zone']) not in self.actions:
-        continue
-
-      if (row['pitch_type'], row['zone']) not in self.actions:
-        continue
-
-      a = list(self.actions).index((row['pitch_type'], row['zone']))
-      s = self.state_lookup[str(row['balls'])+'-'+str(row['strikes'])]
-      a_obs.append(a)
-      s_obs.append(s)
-
-      if row['description'] == 'hit_into_play':
-        if row['events'] == 'field_out':
-          sp_obs.append(13)
-          r_obs.append(R_s[s, 13])
-        else:
-          sp_obs.append(12)
-          r_obs.append(R_s[s, 12])
-
-      elif row['events'] in ['strikeout', 'strikeout_double_play']:
-        sp_obs.append(15)
-        r_obs.append(R_s[s, 15])
-      elif row['events'] in ['walk', 'hit_by_pitch']:
-        sp_obs.append(14)
-        r_obs.append(R_s[s, 14])
-      elif row['description'] in ['called_strike', 'swinging_strike', 'missed_bunt']:
-        sp = self.state_lookup[str(row['balls'])+'-'+str(row['strikes']+1)]
-        sp_obs.append(sp)
-        r_obs.append(R_s[s, sp])
-      elif row['description'] == 'swinging_strike_blocked':
-        if row['strikes'] == 2:
-          sp_obs.append(15)
-          r_obs.append(R_s[s, 15])
-        else:
-          sp = self.state_lookup[str(row['balls'])+'-'+str(row['strikes']+1)]
-          sp_obs.append(sp)
-          r_obs.append(R_s[s, sp])
-      elif row['description'] in ['foul', 'foul_tip', 'foul_bunt']:
-        if row['strikes'] == 2:
-          sp_obs.append(s)
-          r_obs.append(R_s[s, s])
-        else:
-          sp = self.state_lookup[str(row['balls'])+'-'+str(row['strikes']+1)]
-          sp_obs.append(sp)
-          r_obs.append(R_s[s, sp])
-      elif row['description'] in ['ball', 'blocked_ball']:
-        sp = self.state_lookup[str(row['balls']+1)+'-'+str(row['strikes'])]
-        sp_obs.append(sp)
-        r_obs.append(R_s[s, sp])
-      else:
-        print(row)
+    # Pitches that aren't in the action set are skipped, pitches with an outcome we can't
+    # classify are counted and reported once. The count isn't kept on the model, which is
+    # shared by requests encoding different players at the same time.
+    keep = known & matched
+    unmatched = int(np.sum(known & ~matched))
+    if unmatched:
+      print(f"Skipped {unmatched} pitches with an outcome that could not be classified")
 
     obs = pd.DataFrame({
-      's': s_obs,
-      'a': a_obs,
-      'r': r_obs,
-      'sp': sp_obs
+      's': s[keep],
+      'a': a[keep],
+      'r': r[keep],
+      'sp': sp[keep]
     })
     return obs
 
-  def get_pitch_seq(self, Q, arsenal):
-    pi = np.zeros(12)
+  def get_policy(self, Q, arsenal):
+    # Best action index for each count among the pitches in the arsenal; Q is left untouched
+    return np.argmax(np.where(self.actions.mask(arsenal), Q[:12], -np.inf), axis=1)
 
-    for a in self.actions:
-      if a[0] not in arsenal:
-        a = list(self.actions).index((a[0], a[1]))
-        Q[:, a] = -10000
+  def get_pitch_seq(self, Q, arsenal):
+    return [self.actions[a] for a in self.get_policy(Q, arsenal)]
 
-    for s in range(12):
-      pi[s] = max(range(len(Q[s])), key=Q[s].__getitem__)
-    return [self.actions[int(pi[i])] for i in range(12)]
-  
   def generate_heat_map(self, Q, arsenal):
-    min = float('inf')
-    max = -float('inf')
-    heat_map = np.zeros((12, len(arsenal), 16, 10))
-  
-    for a in self.actions:
-      p = a[0]
-      if p not in arsenal:
-        continue
-      p_ind = arsenal.index(p)
-      zone = a[1]
-      a = list(self.actions).index((a[0], a[1]))
-      for s in range(12):
-        Q_value = Q[s, a]
-
-        if (s, p, zone) in self.not_enough_data:
-          Q_value = float('nan')
-        else:
-          if Q_value > max:
-            max = Q_value
-          if Q_value < min:
-            min = Q_value
-        
-        # Now we've extracted Q value, we can build the heat map
-        if zone == 1:
-          heat_map[s, p_ind, 2:6, 2:4] = Q_value  # zone 1
-        elif zone == 2:
-          heat_map[s, p_ind, 2:6, 4:6] = Q_value  # zone 2
-        elif zone == 3:
-          heat_map[s, p_ind, 2:6, 6:8] = Q_value  # zone 3
-        elif zone == 4:
-          heat_map[s, p_ind, 6:10, 2:4] = Q_value  # zone 4
-        elif zone == 5:
-          heat_map[s, p_ind, 6:10, 4:6] = Q_value  # zone 5
-        elif zone == 6:
-          heat_map[s, p_ind, 6:10, 6:8] = Q_value  # zone 6
-        elif zone == 7:
-          heat_map[s, p_ind, 10:14, 2:4] = Q_value  # zone 7
-        elif zone == 8:
-          heat_map[s, p_ind, 10:14, 4:6] = Q_value  # zone 8
-        elif zone == 9:
-          heat_map[s, p_ind, 10:14, 6:8] = Q_value  # zone 9
-        elif zone == 11:
-          heat_map[s, p_ind, 0:2, 0:5] = Q_value  # zone 11
-          heat_map[s, p_ind, 0:8, 0:2] = Q_value  # zone 11
-        elif zone == 12:
-          heat_map[s, p_ind, 0:2, 5:] = Q_value  # zone 12
-          heat_map[s, p_ind, 0:8, 8:] = Q_value  # zone 12
-        elif zone == 13:
-          heat_map[s, p_ind, 8:, 0:2] = Q_value  # zone 13
-          heat_map[s, p_ind, 14:, 0:5] = Q_value  # zone 13
-        elif zone == 14:
-          heat_map[s, p_ind, 14:, 5:] = Q_value  # zone 14
-          heat_map[s, p_ind, 8:, 8:] = Q_value  # zone 14            
-
+    # Q value for every (count, arsenal pitch, zone), NaN where there isn't enough data and 0 for
+    # zones the pitch has no action for. One gather through ZONE_PIXELS turns it into images.
+    columns = [(arsenal.index(self.actions[a][0]), self.actions.zones[a], a) for a in np.flatnonzero(self.actions.mask(arsenal))]
+    values = np.zeros((12, len(arsenal), 15))
+    if columns:
+      p_ind, zones, a = (np.array(c) for c in zip(*columns))
+      Q_values = np.where(self.has_data[:12, a], Q[:12, a], np.nan)
+      values[:, p_ind, zones] = Q_values
+
+    seen = Q_values[~np.isnan(Q_values)] if columns else np.empty(0)
+    min = seen.min() if seen.size else float('inf')
+    max = seen.max() if seen.size else -float('inf')
+    heat_map = values[:, :, ZONE_PIXELS]
     return heat_map, min, max
-        
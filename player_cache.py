@@ -0,0 +1,110 @@
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+import load_statcast
+
+CATEGORICAL = ['pitch_type', 'events', 'description']
+SMALL_INTS = ['zone', 'balls', 'strikes']
+
+class PlayerCache:
+    # Per-player Statcast cache keyed by (role, MLBAM id, date range). Only load_statcast.COLUMNS
+    # are kept (plus game_date, for top-ups), stored in one npz per entry with categorical codes
+    # for the string columns and int8 for zone/balls/strikes (-1 marks a missing zone).
+    # Entries whose range reaches past yesterday are topped up with the newer days once they
+    # are older than ttl seconds; entries covering finished days never go stale.
+    def __init__(self, path='player_cache', fetcher=load_statcast.fetch_player, ttl=6*60*60):
+        self.path = path
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.topups = 0
+        self.versions = {}
+        self.lock = threading.Lock()
+        # one lock per entry, so concurrent requests for the same player fetch it only once
+        self.entry_locks = {}
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, role, player_id, start_dt, end_dt):
+        return os.path.join(self.path, f'{role}_{int(player_id)}_{start_dt}_{end_dt}.npz')
+
+    def get(self, role, player_id, start_dt=load_statcast.START_DT, end_dt=load_statcast.END_DT):
+        path = self.entry_path(role, player_id, start_dt, end_dt)
+        with self.lock:
+            entry_lock = self.entry_locks.setdefault(path, threading.Lock())
+        # Threads that miss on the same entry wait for the first one's fetch and then read its file
+        with entry_lock:
+            return self._get(path, role, player_id, start_dt, end_dt)
+
+    def _get(self, path, role, player_id, start_dt, end_dt):
+        complete_through = min(pd.Timestamp(end_dt), pd.Timestamp.today().normalize() - pd.Timedelta(days=1))
+
+        if not os.path.exists(path):
+            with self.lock:
+                self.misses += 1
+            data = self._fetch(role, player_id, start_dt, end_dt)
+        else:
+            data, fetched_at, stored_through = self._load(path)
+            if stored_through >= pd.Timestamp(end_dt) or time.time() - fetched_at < self.ttl:
+                with self.lock:
+                    self.hits += 1
+                self.versions[(role, player_id, start_dt, end_dt)] = fetched_at
+                return data[load_statcast.COLUMNS]
+
+            # Refetch from the first day that may have been incomplete and replace those rows
+            with self.lock:
+                self.topups += 1
+            top_up_from = stored_through + pd.Timedelta(days=1)
+            newer = self._fetch(role, player_id, top_up_from.strftime('%Y-%m-%d'), end_dt)
+            data = data[data['game_date'] < top_up_from]
+            if len(newer):
+                data = pd.concat([newer, data], ignore_index=True)
+
+        fetched_at = self._save(path, data, complete_through)
+        self.versions[(role, player_id, start_dt, end_dt)] = fetched_at
+        data, _, _ = self._load(path)
+        return data[load_statcast.COLUMNS]
+
+    def version(self, role, player_id, start_dt=load_statcast.START_DT, end_dt=load_statcast.END_DT):
+        # When the entry was last fetched; changes whenever the player's data is refreshed
+        return self.versions.get((role, player_id, start_dt, end_dt))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'topups': self.topups}
+
+    def _fetch(self, role, player_id, start_dt, end_dt):
+        data = self.fetcher(role, player_id, start_dt, end_dt)
+        data = data[data['pitch_type'].notna()]
+        return data[load_statcast.COLUMNS + ['game_date']].assign(game_date=pd.to_datetime(data['game_date']))
+
+    def _save(self, path, data, complete_through):
+        arrays = {}
+        for col in CATEGORICAL:
+            values = data[col].astype('category')
+            arrays[col] = values.cat.codes.to_numpy(dtype=np.int8)
+            arrays[col + '_categories'] = np.asarray(values.cat.categories, dtype=str)
+        for col in SMALL_INTS:
+            arrays[col] = data[col].fillna(-1).to_numpy(dtype=np.int8)
+        arrays['game_date'] = data['game_date'].to_numpy(dtype='datetime64[D]').astype(np.int32)
+
+        fetched_at = time.time()
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, fetched_at=fetched_at, complete_through=str(complete_through.date()), **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return fetched_at
+
+    def _load(self, path):
+        with np.load(path) as z:
+            data = pd.DataFrame({col: pd.Categorical.from_codes(z[col], z[col + '_categories']) for col in CATEGORICAL})
+            for col in SMALL_INTS:
+                data[col] = z[col]
+            data['game_date'] = pd.to_datetime(z['game_date'].astype('datetime64[D]'))
+            return data, float(z['fetched_at']), pd.Timestamp(str(z['complete_through']))
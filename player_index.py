@@ -0,0 +1,99 @@
+import bisect
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+import pandas as pd
+
+SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv'}
+
+def normalize(name):
+    # "Jazz Chisholm Jr." -> "jazz chisholm", "José Ramírez" -> "jose ramirez"
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    tokens = re.sub(r"[^a-z0-9 ]", ' ', re.sub(r"[.']", '', name)).split()
+    return ' '.join(t for t in tokens if t not in SUFFIXES)
+
+def ngrams(text, n=3):
+    text = f' {text} '
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class PlayerIndex:
+    # In-process name -> MLBAM id index built once from the Chadwick register. Lookups try a
+    # normalized exact match on "first last" or the last name alone, then a prefix match, then a
+    # fuzzy match scored on shared trigrams. Ties go to the player who appeared most recently.
+    def __init__(self, register, max_postings=2000):
+        register = register[register['key_mlbam'].notna() & register['mlb_played_first'].notna()]
+        self.names = [f"{first} {last}" for first, last in zip(register['name_first'], register['name_last'])]
+        self.ids = [int(key) for key in register['key_mlbam']]
+        self.last_played = [int(year) if year == year else 0 for year in register['mlb_played_last']]
+        self.max_postings = max_postings
+
+        self.exact = defaultdict(list)
+        keys = []
+        self.grams = []
+        self.postings = defaultdict(list)
+        for i, (first, last) in enumerate(zip(register['name_first'], register['name_last'])):
+            full = normalize(f"{first} {last}")
+            for key in {full, normalize(str(last)), normalize(f"{last} {first}")}:
+                self.exact[key].append(i)
+                keys.append((key, i))
+            grams = ngrams(full)
+            self.grams.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(i)
+        keys.sort()
+        self.prefix_keys = [key for key, _ in keys]
+        self.prefix_ids = [i for _, i in keys]
+
+    @classmethod
+    def from_register(cls, cache_path='player_register.csv'):
+        # The register is trimmed to MLB players and kept on disk, so only the first start
+        # has to download it
+        if os.path.exists(cache_path):
+            return cls(pd.read_csv(cache_path))
+        from pybaseball import chadwick_register
+        register = chadwick_register()
+        register = register[register['key_mlbam'].notna() & register['mlb_played_first'].notna()]
+        register = register[['name_first', 'name_last', 'key_mlbam', 'mlb_played_first', 'mlb_played_last']]
+        register.to_csv(cache_path, index=False)
+        return cls(register)
+
+    def search(self, query, limit=10):
+        # Ranked (name, mlbam id, score) matches for query; score is 1 for an exact match,
+        # 0.9 for a prefix match and the trigram Dice coefficient for a fuzzy match
+        query = normalize(query)
+        if not query:
+            return []
+
+        scores = {i: 1.0 for i in self.exact.get(query, [])}
+        if len(scores) < limit:
+            start = bisect.bisect_left(self.prefix_keys, query)
+            end = bisect.bisect_right(self.prefix_keys, query + '\x7f')
+            for i in self.prefix_ids[start:end]:
+                scores.setdefault(i, 0.9)
+        if not scores:
+            scores = self._fuzzy(query)
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], -self.last_played[i]))[:limit]
+        return [(self.names[i], self.ids[i], scores[i]) for i in ranked]
+
+    def resolve(self, query):
+        matches = self.search(query, limit=1)
+        if not matches:
+            raise ValueError(f"No player found matching '{query}'")
+        return matches[0][1]
+
+    def player_id(self, name):
+        # name can also be an MLBAM id, which is what API clients and scripts usually pass
+        return int(name) if str(name).isdigit() else self.resolve(name)
+
+    def _fuzzy(self, query, min_score=0.3):
+        # Very common trigrams are skipped so the number of candidates stays bounded
+        grams = ngrams(query)
+        shared = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram, [])
+            if len(posting) <= self.max_postings:
+                shared.update(posting)
+        scores = {i: 2*n / (len(grams) + self.grams[i]) for i, n in shared.items()}
+        return {i: score for i, score in scores.items() if score >= min_score}
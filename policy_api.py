@@ -0,0 +1,93 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+# Small JSON endpoint for machine clients that only need the pitch sequence or Q values, no plots:
+#   GET /policy?pitcher=Gerrit+Cole&batter=Shohei+Ohtani[&solver=Model-based][&q=1]
+# When a metrics registry is passed it also serves
+#   GET /metrics                  p50/p95 per stage and cache stats
+#   GET /profile[?min_ms=5000]    profile the next UI request, kept if it takes at least min_ms
+# /profile only answers local clients, or remote ones sending profile_token in an X-Profile-Token header.
+
+logger = logging.getLogger(__name__)
+
+def policy_json(p, pitcher, batter, solver, policy, arsenal, q=None):
+    states = list(p.state_lookup)
+    body = {
+        'pitcher': int(pitcher),
+        'batter': int(batter),
+        'solver': solver,
+        'sequence': [{'count': states[s], 'pitch_type': p.actions[a][0], 'pitch': p.pitches.get(p.actions[a][0]),
+                      'zone': int(p.actions[a][1])} for s, a in enumerate(policy)]
+    }
+    if q is not None:
+        # Q rows for each count, restricted to the pitcher's arsenal
+        arsenal_actions = np.flatnonzero(p.actions.mask(arsenal))
+        body['q'] = {states[s]: [{'pitch_type': p.actions[a][0], 'zone': int(p.actions[a][1]), 'q': float(q[s, a])}
+                                 for a in arsenal_actions] for s in range(12)}
+    return body
+
+LOCAL = ('127.0.0.1', '::1', '::ffff:127.0.0.1')
+
+def make_handler(query, metrics=None, profile_token=None):
+    # query(pitcher, batter, solver, q) returns the response body or raises ValueError/KeyError
+    class PolicyHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if metrics is not None and url.path == '/metrics':
+                return self.send_json(200, metrics.summary())
+            if metrics is not None and url.path == '/profile':
+                if not self.may_profile():
+                    return self.send_json(403, {'error': 'forbidden'})
+                try:
+                    min_ms = float(params.get('min_ms', 0))
+                except ValueError:
+                    return self.send_json(400, {'error': 'min_ms must be a number'})
+                metrics.arm_profile(min_ms)
+                return self.send_json(200, {'armed': True, 'min_ms': min_ms})
+            if url.path != '/policy':
+                return self.send_json(404, {'error': 'not found'})
+            missing = [key for key in ('pitcher', 'batter') if key not in params]
+            if missing:
+                return self.send_json(400, {'error': f"missing parameter(s): {', '.join(missing)}"})
+            try:
+                body = query(params['pitcher'], params['batter'], params.get('solver', 'Q-learning'),
+                             params.get('q', '0') not in ('0', 'false', ''))
+            except (KeyError, ValueError) as e:
+                return self.send_json(400, {'error': str(e)})
+            except Exception:
+                # Anything else is a bug on our side, the client still gets JSON back
+                logger.exception("policy request failed: %s", self.path)
+                return self.send_json(500, {'error': 'internal error'})
+            self.send_json(200, body)
+
+        def may_profile(self):
+            if self.client_address[0] in LOCAL:
+                return True
+            token = self.headers.get('X-Profile-Token')
+            return bool(profile_token) and token is not None and hmac.compare_digest(token.encode(), profile_token.encode())
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PolicyHandler
+
+def serve(query, port=7861, host='127.0.0.1', metrics=None, profile_token=None):
+    # Serves in a daemon thread next to the Gradio app; returns the server so it can be shut down.
+    # Only local clients can connect unless another host is given.
+    server = ThreadingHTTPServer((host, port), make_handler(query, metrics, profile_token))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,43 @@
+import json
+import sqlite3
+import threading
+import numpy as np
+
+class PolicyStore:
+    # Computed matchups in an indexed sqlite table: the 12-count policy (action indices), the
+    # pitcher's arsenal and Q[:12] for every (pitcher, batter, solver). version identifies the
+    # league model, player data and training settings the entry was computed from; a lookup
+    # with a different version is a miss.
+    def __init__(self, path='policies.sqlite'):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self.lock, self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS matchups (
+                                 pitcher INTEGER, batter INTEGER, solver TEXT, version TEXT,
+                                 policy TEXT, arsenal TEXT, actions INTEGER, q BLOB,
+                                 PRIMARY KEY (pitcher, batter, solver))''')
+
+    def get(self, pitcher, batter, solver, version):
+        with self.lock:
+            row = self.db.execute('SELECT version, policy, arsenal, actions, q FROM matchups '
+                                  'WHERE pitcher = ? AND batter = ? AND solver = ?',
+                                  (int(pitcher), int(batter), solver)).fetchone()
+            if row is None or row[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+        _, policy, arsenal, actions, q = row
+        return json.loads(policy), json.loads(arsenal), np.frombuffer(q, dtype=np.float64).reshape(12, actions)
+
+    def put(self, pitcher, batter, solver, version, policy, arsenal, q):
+        q = np.ascontiguousarray(q, dtype=np.float64)
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO matchups VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (int(pitcher), int(batter), solver, version, json.dumps([int(a) for a in policy]),
+                             json.dumps([str(pitch) for pitch in arsenal]), q.shape[1], q.tobytes()))
+        return policy, arsenal, q
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
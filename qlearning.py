@@ -1,43 +1,95 @@
 import numpy as np
+from transitions import SparseT
 
 class QLearning:
-    def __init__(self, p):
-        self.R = p.get_R()
-        self.T = p.get_T()
+    def __init__(self, p, sparse=False):
+        # With sparse set the model runs on p.get_sparse_T(), which is what larger state spaces
+        # (see base_out.py) provide instead of a dense T
+        self.R_s = p.get_Rs()
+        self.T = p.get_sparse_T() if sparse else p.get_T()
+        self.R = expected_reward(self.T, self.R_s) if sparse else p.get_R()
+        self.has_data = p.has_data
+        # States past the 12 counts (HIT, OUT, WALK, STRIKEOUT) are absorbing with zero reward
+        self.n_transient = len(p.state_lookup)
+        self.iterations = None
+        self.residual = None
+
+    def backup(self, U, gamma=1, T=None, R=None):
+        # Q(s, a) = R(s, a) + gamma * sum_s' T(s' | s, a) U(s') for every (s, a) in one contraction
+        T = self.T if T is None else T
+        R = self.R if R is None else R
+        return R + gamma * expect(T, U)
 
     def bellman_backup(self, U, s, gamma=1):
-        maximum = float('-inf')
-        for a in range(134):
-            maximum = max(maximum, self.R[s, a] + gamma * np.sum([self.T[s, a, sp]*U[sp] for sp in range(16)]))
-        return maximum
+        if isinstance(self.T, SparseT):
+            return np.max(self.R[s] + gamma * np.sum(self.T.prob[s] * U[self.T.idx[s]], axis=-1))
+        return np.max(self.R[s] + gamma * (self.T[s] @ U))
 
-    def value_iteration(self):
-        U = np.zeros(16)
-        for k in range(1000):
-            U = np.array([self.bellman_backup(U, s) for s in range(16)])
+    def value_iteration(self, gamma=1, tol=1e-10, max_iter=1000, T=None, R=None):
+        # Stops once the largest change in U is at most tol; the number of sweeps and the
+        # final residual are kept in self.iterations and self.residual
+        T = self.T if T is None else T
+        U = np.zeros(T.shape[:-3] + T.shape[-1:])
+        for k in range(max_iter):
+            U_new = self.backup(U, gamma, T, R).max(axis=-1)
+            residual = np.max(np.abs(U_new - U))
+            U = U_new
+            if residual <= tol:
+                break
+        self.iterations = k + 1
+        self.residual = residual
         return U
 
-    def eval_random(self, gamma = 1):
-        U = np.zeros(16)
-        for k in range(1000):
-            a = np.random.randint(0, 133)
-            U = np.array([(self.R[s, a] + gamma * np.sum([self.T[s, a, sp]*U[sp] for sp in range(16)])) for s in range(16)])
+    def evaluate_policy(self, pi, gamma=1, T=None, R=None):
+        # Exact U^pi from one linear solve over the transient states. The absorbing states have
+        # zero reward so their value is 0 and they drop out of (I - gamma T_pi) U = R_pi.
+        T = self.T if T is None else T
+        R = self.R if R is None else R
+        n = self.n_transient
+        s = np.arange(n)
+        U = np.zeros(T.shape[-1])
+        T_pi = T.rows(s, pi[:n]) if isinstance(T, SparseT) else T[s, pi[:n]]
+        U[:n] = np.linalg.solve(np.eye(n) - gamma * T_pi[:, :n], R[s, pi[:n]])
+        return U
+
+    def policy_iteration(self, gamma=1, max_iter=100, T=None, R=None):
+        # Exact alternative to value_iteration: evaluate the greedy policy with a linear solve
+        # and improve it until it stops changing
+        pi = np.argmax(self.R if R is None else R, axis=1)
+        for k in range(max_iter):
+            U = self.evaluate_policy(pi, gamma, T, R)
+            pi_new = np.argmax(self.backup(U, gamma, T, R), axis=1)
+            if np.array_equal(pi_new, pi):
+                break
+            pi = pi_new
+        self.iterations = k + 1
+        self.residual = 0.0
         return U
 
+    def eval_random(self, gamma = 1, runs=None):
+        # Value of a policy that picks a uniformly random action at every sweep. With runs set,
+        # that many independent evaluations are done together and returned as a (runs, S) array.
+        n = 1 if runs is None else runs
+        a = np.random.randint(0, self.T.shape[-2], size=(n, 1000))
+        U = np.zeros((n, self.T.shape[-1]))
+        runs_index = np.arange(n)[np.newaxis, :, np.newaxis]
+        for k in range(1000):
+            if isinstance(self.T, SparseT):
+                U_next = np.sum(self.T.prob[:, a[:, k]] * U[runs_index, self.T.idx[:, a[:, k]]], axis=-1).T
+            else:
+                U_next = np.einsum('iaj,aj->ai', self.T[:, a[:, k], :], U)
+            U = self.R[:, a[:, k]].T + gamma * U_next
+        return U[0] if runs is None else U
+
     def initialize_q(self, gamma=1):
         # Run value iteration first to get an initial value for U over the whole dataset.
-        U = self.value_iteration()  # ignore the last four elements of this array
+        U = self.value_iteration(gamma)  # ignore the last four elements of this array
+        self.U = U
 
-        U_rand = np.zeros((100, 16))
-        for i in range(100):
-            U_rand[i, :] = self.eval_random()    
+        U_rand = self.eval_random(gamma, runs=100)
 
         # Initialize Q for Q learning
-        Q = np.zeros((16, 134))
-
-        for s in range(16):
-            for a in range(134):
-                Q[s,a] = self.R[s, a] + np.sum([self.T[s, a, sp]*U[sp] for sp in range(16)])
+        Q = self.backup(U, gamma)
 
         return Q, U_rand
 
@@ -48,9 +100,123 @@ class QLearning:
             pi[s] = max(range(len(Q[s])), key=Q[s].__getitem__)
         return [actions[int(pi[i])] for i in range(12)]
 
-    def QLearn(self, Q, obs, eta, gamma=1):
-        for i in range(100):
-            for _, row in obs.iterrows():
-                s, a, r, sp = int(row['s']), int(row['a']), row['r'], int(row['sp'])
-                Q[s, a] = Q[s, a] + eta*(r + gamma*max(Q[sp,:]) - Q[s, a]) # Update Q
-        return Q
\ No newline at end of file
+    def blend_T(self, obs, prior_weight=20, T=None):
+        # Player transition model: the observed counts N(s, a, s') blended with a prior T (the
+        # league T by default) that is worth prior_weight pitches per (s, a). Cells without
+        # league data keep the prior, so they still go to HIT like not_enough_data says.
+        T = self.T if T is None else T
+        S, A = T.shape[-3:-1]
+        s, a, r, sp = obs_arrays(obs)
+        if isinstance(T, SparseT):
+            return blend_sparse(T, s, a, sp, prior_weight, self.has_data)
+        N = np.bincount((s*A + a)*S + sp, minlength=S*A*S).reshape(S, A, S)
+        blended = (prior_weight*T + N) / (prior_weight + N.sum(axis=-1, keepdims=True))
+        return np.where(self.has_data[..., np.newaxis], blended, T)
+
+    def model_based_q(self, obs, prior_weight=20, gamma=1, T=None):
+        # Fast alternative to QLearn: solve the blended MDP directly instead of replaying obs.
+        # Returns Q and the blended T, which can serve as the prior for the next player.
+        T = self.blend_T(obs, prior_weight, T)
+        R = expected_reward(T, self.R_s)
+        U = self.value_iteration(gamma, T=T, R=R)
+        return self.backup(U, gamma, T, R), T
+
+    def QLearn(self, Q, obs, eta, gamma=1, epochs=100, mode='sequential', tol=None):
+        # Q is updated in place and returned. 'sequential' replays obs in order exactly like
+        # the original row-by-row loop; 'batched' applies each epoch as grouped array updates.
+        # With tol set, training stops after the first epoch whose largest change is below tol.
+        update = td_sequential if mode == 'sequential' else td_batched
+        self.epochs = update(Q, *obs_arrays(obs), eta, gamma, epochs, tol)
+        return Q
+
+# League Q handed to each worker process once, see init_worker
+league_Q = None
+
+def init_worker(Q):
+    global league_Q
+    league_Q = np.array(Q)
+    league_Q.setflags(write=False)
+
+def q_learn(obs, eta, gamma=1, Q=None, epochs=100, mode='sequential', tol=None):
+    # Process pool entry point: trains a copy of Q (the worker's league Q when Q is None)
+    Q = (league_Q if Q is None else Q).copy()
+    update = td_sequential if mode == 'sequential' else td_batched
+    update(Q, *obs_arrays(obs), eta, gamma, epochs, tol)
+    return Q
+
+def expect(T, U):
+    # sum_s' T(s' | s, a) U(s') for a dense or sparse T, with any leading dimensions carried through
+    if isinstance(T, SparseT):
+        return T.expect(U)
+    return np.einsum('...ijk,...k->...ij', T, U)
+
+def expected_reward(T, R_s):
+    if isinstance(T, SparseT):
+        return T.reward(R_s)
+    return np.sum(R_s[:, np.newaxis, :] * T, axis=-1)
+
+def slot_counts(T, s, a, sp, weights=None):
+    # Observed (s, a, s') counts gathered onto the successor slots of a SparseT, so nothing of
+    # size S*A*S is ever built. Observed successors T can't reach are left out. weights of
+    # shape (B, n) count each observation that many times in each of B replicates.
+    S, A, K = T.idx.shape
+    match = (T.idx[s, a] == sp[:, np.newaxis]) & T.first()[s, a]
+    seen = match.any(axis=1)
+    flat = ((s*A + a)*K + match.argmax(axis=1))[seen]
+    w = (np.ones(len(s)) if weights is None else np.asarray(weights, dtype=np.float64))[..., seen]
+    N = np.zeros(w.shape[:-1] + (S*A*K,))
+    order = np.argsort(flat, kind='stable')
+    cells, starts = np.unique(flat[order], return_index=True)
+    if len(cells):
+        N[..., cells] = np.add.reduceat(w[..., order], starts, axis=-1)
+    return N.reshape(w.shape[:-1] + (S, A, K))
+
+def blend_sparse(T, s, a, sp, prior_weight, has_data, weights=None):
+    # blend_T on a SparseT, see slot_counts for weights
+    N = slot_counts(T, s, a, sp, weights)
+    blended = (prior_weight*T.prob + N) / (prior_weight + N.sum(axis=-1, keepdims=True))
+    return SparseT(T.idx, np.where(has_data[..., np.newaxis], blended, T.prob), T.n_states)
+
+def obs_arrays(obs):
+    # Contiguous (s, a, r, sp) arrays from a get_obs frame, converted once per training call
+    return (np.ascontiguousarray(obs['s'], dtype=np.int64), np.ascontiguousarray(obs['a'], dtype=np.int64),
+            np.ascontiguousarray(obs['r'], dtype=np.float64), np.ascontiguousarray(obs['sp'], dtype=np.int64))
+
+def td_sequential(Q, s, a, r, sp, eta, gamma, epochs, tol=None):
+    # Scalar TD updates on plain Python floats with a running max of every row of Q, which
+    # avoids a max over all actions per update and gives bit-for-bit the same Q as
+    # Q[s, a] += eta*(r + gamma*max(Q[sp, :]) - Q[s, a]) over obs.iterrows()
+    rows = Q.tolist()
+    row_max = [max(row) for row in rows]
+    samples = list(zip(s.tolist(), a.tolist(), r.tolist(), sp.tolist()))
+    for epoch in range(epochs):
+        change = 0.0
+        for si, ai, ri, spi in samples:
+            row = rows[si]
+            old = row[ai]
+            new = old + eta*(ri + gamma*row_max[spi] - old)
+            row[ai] = new
+            if new >= row_max[si]:
+                row_max[si] = new
+            elif old == row_max[si]:
+                row_max[si] = max(row)
+            change = max(change, abs(new - old))
+        if tol is not None and change < tol:
+            break
+    Q[:] = rows
+    return epoch + 1
+
+def td_batched(Q, s, a, r, sp, eta, gamma, epochs, tol=None):
+    # Synchronous updates: every target in an epoch uses Q from the start of the epoch. Each
+    # (s, a) observed n times moves toward its mean target by 1 - (1 - eta)^n, which is where
+    # n sequential updates toward a fixed target would leave it.
+    cells, inverse, n = np.unique(s * Q.shape[1] + a, return_inverse=True, return_counts=True)
+    cs, ca = np.divmod(cells, Q.shape[1])
+    step = 1 - (1 - eta)**n
+    for epoch in range(epochs):
+        target = r + gamma * Q.max(axis=1)[sp]
+        delta = step * (np.bincount(inverse, weights=target, minlength=len(cells)) / n - Q[cs, ca])
+        Q[cs, ca] += delta
+        if tol is not None and np.max(np.abs(delta), initial=0) < tol:
+            break
+    return epoch + 1
@@ -0,0 +1,47 @@
+import io
+import numpy as np
+
+def heat_map_canvas(heat_map, gap=1):
+    # Tiles the (12, pitches, 16, 10) heat map into one image: a 3x4 block of counts per pitch,
+    # pitches stacked top to bottom, with a NaN border between panels
+    counts, pitches, height, width = heat_map.shape
+    canvas = np.full((3*pitches*(height + gap) - gap, 4*(width + gap) - gap), np.nan)
+    for i in range(pitches):
+        for j in range(counts):
+            row = (3*i + j // 4) * (height + gap)
+            col = (j % 4) * (width + gap)
+            canvas[row:row + height, col:col + width] = heat_map[j, i]
+    return canvas
+
+def render_heat_map(heat_map, arsenal, states, vmin, vmax, png=False):
+    # Draws every (pitch, count) panel into a single image on one shared color scale.
+    # Returns a matplotlib Figure, or the PNG bytes when png is set (handy for caching).
+    from matplotlib.figure import Figure
+    from matplotlib import colormaps
+
+    counts, pitches, height, width = heat_map.shape
+    fig = Figure(figsize=(8, max(2.5, 3*pitches*2.2)))
+    if pitches == 0:
+        # nothing to draw, e.g. a pitcher with no pitches on record
+        return to_png(fig) if png else fig
+
+    canvas = heat_map_canvas(heat_map)
+    ax = fig.add_axes([0.02, 0.01, 0.86, 0.97])
+    cmap = colormaps['RdBu'].copy()
+    cmap.set_bad('white')
+    finite = np.isfinite([vmin, vmax]).all()
+    image = ax.imshow(canvas, cmap=cmap, vmin=vmin if finite else None, vmax=vmax if finite else None,
+                      interpolation='nearest')
+    for i in range(pitches):
+        for j in range(counts):
+            ax.text((j % 4)*(width + 1), (3*i + j // 4)*(height + 1) - 0.7, f'{arsenal[i]} in {states[j]}',
+                    fontsize=7, va='bottom')
+    ax.set_axis_off()
+    fig.colorbar(image, cax=fig.add_axes([0.9, 0.3, 0.03, 0.4]))
+
+    return to_png(fig) if png else fig
+
+def to_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=100)
+    return buffer.getvalue()
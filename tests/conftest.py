@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+# The app's modules live at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import load_statcast
+from benchmarks import synthetic
+
+@pytest.fixture(scope='session')
+def league():
+    # A small season, so some (count, pitch, zone) cells have no data
+    d = synthetic.statcast(20000, seed=5)
+    return load_statcast.get_probabilities(load_statcast.aggregate_counts(d))
+
+@pytest.fixture(scope='session')
+def pitcher():
+    return synthetic.player(1500, seed=6)[load_statcast.COLUMNS]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import load_statcast
+from benchmarks import synthetic
+
+COUNTERS = ['totals', 'swings', 'whiffs', 'strikes', 'hits', 'fouls']
+
+def iterrows_counts(d):
+  # The original per-count iterrows loop from retrieve_data, without the +1 smoothing
+  counts = {}
+  for i in range(12):
+    d_split = d[(d['balls'] == i // 3) & (d['strikes'] == i % 3)]
+    for idx, pitch in d_split.iterrows():
+      c = counts.setdefault((i, pitch['pitch_type'], pitch['zone']), dict.fromkeys(COUNTERS, 0))
+      c['totals'] += 1
+      if pitch['description'] in ['swinging_strike', 'hit_into_play', 'foul']:
+        c['swings'] += 1
+      if pitch['description'] == 'swinging_strike':
+        c['whiffs'] += 1
+      if pitch['description'] == 'called_strike':
+        c['strikes'] += 1
+      if pitch['events'] in ['single', 'double', 'triple', 'home_run']:
+        c['hits'] += 1
+      if pitch['description'] == 'foul':
+        c['fouls'] += 1
+  return counts
+
+def fixture():
+  d = synthetic.statcast(2000, seed=3)
+  d.loc[[5, 17, 40], 'zone'] = np.nan
+  d.loc[[7, 90], 'pitch_type'] = None
+  return d[load_statcast.COLUMNS]
+
+def test_matches_iterrows_loop():
+  d = fixture()
+  expected = {k: v for k, v in iterrows_counts(d).items() if isinstance(k[1], str) and not pd.isna(k[2])}
+  counts = load_statcast.aggregate_counts(d)
+
+  assert list(counts.index) == list(expected)
+  assert counts[COUNTERS].to_dict('records') == list(expected.values())
+
+def test_drops_pitches_without_type_or_zone():
+  # The old loop kept a cell for each of these pitches (NaN keys never compare equal, so they
+  # were never pooled); none of them can be an action, so aggregate_counts leaves them out
+  d = fixture()
+  counts = load_statcast.aggregate_counts(d)
+  incomplete = d['pitch_type'].isna() | d['zone'].isna()
+
+  assert not counts.index.get_level_values(1).isna().any()
+  assert not counts.index.get_level_values(2).isna().any()
+  assert counts['totals'].sum() == (~incomplete).sum()
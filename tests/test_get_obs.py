@@ -0,0 +1,54 @@
+import pandas as pd
+from pitch_perfect import PitchPerfect
+
+def loop_obs(p, data):
+  # The original iterrows get_obs, returning the frame and the number of rows no rule matched.
+  # The original printed those rows and then failed to build the frame.
+  s_obs, a_obs, r_obs, sp_obs = [], [], [], []
+  unmatched = 0
+  R_s = p.get_Rs()
+  actions = list(p.actions)
+  for _, row in data.iterrows():
+    if (row['pitch_type'], row['zone']) not in actions:
+      continue
+    a = actions.index((row['pitch_type'], row['zone']))
+    s = p.state_lookup[str(row['balls'])+'-'+str(row['strikes'])]
+
+    if row['description'] == 'hit_into_play':
+      sp = 13 if row['events'] == 'field_out' else 12
+    elif row['events'] in ['strikeout', 'strikeout_double_play']:
+      sp = 15
+    elif row['events'] in ['walk', 'hit_by_pitch']:
+      sp = 14
+    elif row['description'] in ['called_strike', 'swinging_strike', 'missed_bunt']:
+      sp = p.state_lookup[str(row['balls'])+'-'+str(row['strikes']+1)]
+    elif row['description'] == 'swinging_strike_blocked':
+      sp = 15 if row['strikes'] == 2 else p.state_lookup[str(row['balls'])+'-'+str(row['strikes']+1)]
+    elif row['description'] in ['foul', 'foul_tip', 'foul_bunt']:
+      sp = s if row['strikes'] == 2 else p.state_lookup[str(row['balls'])+'-'+str(row['strikes']+1)]
+    elif row['description'] in ['ball', 'blocked_ball']:
+      sp = p.state_lookup[str(row['balls']+1)+'-'+str(row['strikes'])]
+    else:
+      unmatched += 1
+      continue
+    s_obs.append(s)
+    a_obs.append(a)
+    r_obs.append(R_s[s, sp])
+    sp_obs.append(sp)
+  return pd.DataFrame({'s': s_obs, 'a': a_obs, 'r': r_obs, 'sp': sp_obs}), unmatched
+
+def with_unmatched(pitcher):
+  # A few pitches no rule classifies, and one that isn't an action
+  d = pitcher.copy()
+  d.loc[[3, 50, 51], 'description'] = 'pitchout'
+  d.loc[[3, 50, 51], 'events'] = None
+  d.loc[8, 'zone'] = 99.0
+  return d
+
+def test_matches_loop(league, pitcher, capsys):
+  p = PitchPerfect(league)
+  d = with_unmatched(pitcher)
+  expected, unmatched = loop_obs(p, d)
+  assert unmatched > 0
+  pd.testing.assert_frame_equal(p.get_obs(d), expected)
+  assert capsys.readouterr().out == f"Skipped {unmatched} pitches with an outcome that could not be classified\n"
@@ -0,0 +1,21 @@
+import numpy as np
+from pitch_perfect import PitchPerfect
+from qlearning import QLearning, q_learn
+
+def loop_QLearn(Q, obs, eta, gamma, epochs):
+  # The original iterrows QLearn
+  for i in range(epochs):
+    for _, row in obs.iterrows():
+      s, a, r, sp = int(row['s']), int(row['a']), row['r'], int(row['sp'])
+      Q[s, a] = Q[s, a] + eta*(r + gamma*max(Q[sp,:]) - Q[s, a])
+  return Q
+
+def test_sequential_matches_loop(league, pitcher):
+  p = PitchPerfect(league)
+  model = QLearning(p)
+  Q, _ = model.initialize_q(0.99)
+  obs = p.get_obs(pitcher)
+  expected = loop_QLearn(Q.copy(), obs, 0.01, 0.99, 3)
+
+  np.testing.assert_array_equal(model.QLearn(Q.copy(), obs, 0.01, 0.99, epochs=3), expected)
+  np.testing.assert_array_equal(q_learn(obs, 0.01, 0.99, Q, epochs=3), expected)
@@ -0,0 +1,16 @@
+import pandas as pd
+import load_statcast
+from benchmarks import synthetic
+
+def fetcher_for(d):
+  def fetcher(start_dt, end_dt):
+    return d[(d['game_date'] >= start_dt) & (d['game_date'] <= end_dt)]
+  return fetcher
+
+def test_streaming_matches_in_memory():
+  d = synthetic.statcast(20000, seed=7)
+  fetcher = fetcher_for(d)
+  in_memory = load_statcast.retrieve_data(load_statcast.START_DT, load_statcast.END_DT, fetcher=fetcher)
+  for chunk_days in [1, 7, 30]:
+    streamed = load_statcast.retrieve_data(load_statcast.START_DT, load_statcast.END_DT, fetcher=fetcher, chunk_days=chunk_days)
+    pd.testing.assert_frame_equal(streamed, in_memory)
@@ -0,0 +1,45 @@
+import numpy as np
+from pitch_perfect import PitchPerfect
+
+def loop_T(p):
+  # The original per-cell get_T loop and its T_* helpers, over p's action set
+  d = p.data
+  T = np.zeros((16, len(p.actions), 16))
+  for s in range(16):
+    for a, (pitch_type, zone) in enumerate(p.actions):
+      k = (s, pitch_type, float(zone))
+      if k not in d.index:
+        T[s, a, -4] = 1
+        continue
+      sw, wh, ht, st, fo = (d.loc[k][col] for col in ['Swing %', 'Whiff %', 'Hit Prob', 'Strike Prob', 'Foul %'])
+      T[s, a, -4] = sw*ht
+      T[s, a, -3] = sw*(1-ht-wh-fo)
+      T[s, a, -2] = 0 if s < 9 else (1-sw)*(1-st)
+      T[s, a, -1] = 0 if (s + 1) % 3 != 0 else sw*wh + (1-sw)*st
+      if (s + 1) % 3 != 0:
+        T[s, a, s+1] = (1-sw)*st + sw*(wh+fo)
+      if s < 9:
+        T[s, a, s+3] = (1-sw)*(1-st)
+      if (s + 1) % 3 == 0:
+        T[s, a, s] = sw*fo
+  return T
+
+def test_T_matches_loop(league):
+  p = PitchPerfect(league)
+  np.testing.assert_array_equal(p.get_T(), loop_T(p))
+
+def test_R_matches_loop(league):
+  p = PitchPerfect(league)
+  R_sas = np.tile(np.expand_dims(p.get_Rs(), axis=1), (1, len(p.actions), 1))
+  np.testing.assert_array_equal(p.get_R(), np.sum(R_sas * loop_T(p), axis=2))
+
+def test_not_enough_data_goes_to_hit(league):
+  p = PitchPerfect(league)
+  expected = {(s, pitch_type, zone) for s in range(16) for pitch_type, zone in p.actions
+              if (s, pitch_type, float(zone)) not in league.index}
+  assert expected and p.not_enough_data == expected
+
+  T = p.get_T()
+  for s, pitch_type, zone in expected:
+    a = p.actions.index[(pitch_type, zone)]
+    np.testing.assert_array_equal(T[s, a], np.eye(16)[12])
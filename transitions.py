@@ -0,0 +1,83 @@
+import numpy as np
+
+class SparseT:
+    # T(s' | s, a) stored as the few successors each (s, a) can reach: idx[..., s, a, k] is the
+    # k-th successor state and prob[..., s, a, k] its probability. Unused slots have probability 0.
+    # Memory is S*A*K instead of S*A*S, so the state space can grow without a dense T.
+    def __init__(self, idx, prob, n_states):
+        self.idx = np.asarray(idx, dtype=np.int64)
+        self.prob = np.asarray(prob, dtype=np.float64)
+        self.n_states = n_states
+
+    @property
+    def shape(self):
+        # Shape of the dense T this stands for, so code that reads T.shape works on both
+        return self.prob.shape[:-1] + (self.n_states,)
+
+    @classmethod
+    def from_dense(cls, T):
+        # Keeps the nonzero entries of every row, padded to the longest row
+        k = max(int(np.count_nonzero(T, axis=-1).max()), 1)
+        idx = np.argsort(T == 0, axis=-1, kind='stable')[..., :k]
+        return cls(idx, np.take_along_axis(T, idx, axis=-1), T.shape[-1])
+
+    def todense(self):
+        T = np.zeros(self.shape)
+        lead = np.indices(self.idx.shape, sparse=True)[:-1]
+        np.add.at(T, tuple(lead) + (self.idx,), self.prob)
+        return T
+
+    def expect(self, U):
+        # sum_s' T(s' | s, a) U(s') for every (s, a); U may carry the same leading dimensions as T.
+        # idx can be shared by all leading dimensions of prob (e.g. bootstrap replicates).
+        if U.ndim == 1:
+            return np.sum(self.prob * U[self.idx], axis=-1)
+        idx = np.broadcast_to(self.idx, self.prob.shape)
+        return np.sum(self.prob * np.take_along_axis(U[..., np.newaxis, np.newaxis, :], idx, axis=-1), axis=-1)
+
+    def reward(self, R_s):
+        # R(s, a) = sum_s' T(s' | s, a) R_s(s, s')
+        s = np.arange(self.idx.shape[-3])[:, np.newaxis, np.newaxis]
+        return np.sum(self.prob * R_s[s, self.idx], axis=-1)
+
+    def rows(self, s, a):
+        # Dense T(. | s[i], a[i]) rows, e.g. the rows of one policy for a linear solve
+        M = np.zeros((len(s), self.n_states))
+        np.add.at(M, (np.arange(len(s))[:, np.newaxis], self.idx[s, a]), self.prob[s, a])
+        return M
+
+    def first(self):
+        # Mask of slots holding the first occurrence of their successor within the row, so
+        # per-successor counts gathered through idx are not counted twice
+        same = self.idx[..., :, np.newaxis] == self.idx[..., np.newaxis, :]
+        return ~np.any(np.tril(same, k=-1), axis=-1)
+
+def count_transitions(swing, whiff, hit, strike, foul, has_data):
+    # Sparse version of pitch_perfect.transition_matrix with a fixed slot per outcome:
+    # HIT, OUT, WALK, STRIKEOUT, strike (or foul with 2 strikes), ball. The layout is the same
+    # for every row, which lets base_out expand the slots into base-out successors. Leading
+    # dimensions of the probability arrays end up on prob only, idx is shared.
+    idx = np.zeros(has_data.shape + (6,), dtype=np.int64)
+    prob = np.zeros(np.broadcast_shapes(swing.shape, has_data.shape) + (6,))
+    idx[..., 0], idx[..., 1], idx[..., 2], idx[..., 3] = 12, 13, 14, 15
+    for s in range(12):
+        sw, wh, ht, st, fo = (x[..., s, :] for x in (swing, whiff, hit, strike, foul))
+
+        prob[..., s, :, 0] = sw*ht # hit probability
+        prob[..., s, :, 1] = sw*(1-ht-wh-fo) # out probability
+        if s >= 9:
+            prob[..., s, :, 2] = (1-sw)*(1-st) # walk probability
+        if (s + 1) % 3 == 0:
+            prob[..., s, :, 3] = sw*wh + (1-sw)*st # strikeout probability
+            idx[..., s, :, 4] = s
+            prob[..., s, :, 4] = sw*fo # foul probability (only if we already have 2 strikes)
+        else:
+            idx[..., s, :, 4] = s+1
+            prob[..., s, :, 4] = (1-sw)*st + sw*(wh+fo) # strike probability
+        idx[..., s, :, 5] = s+3 if s < 9 else s
+        if s < 9:
+            prob[..., s, :, 5] = (1-sw)*(1-st) # ball probability
+
+    # same as the dense version: no data (and the end states) means a HIT with probability 1
+    prob = np.where(has_data[..., np.newaxis], prob, np.eye(6)[0])
+    return SparseT(idx, prob, 16)